@@ -0,0 +1,106 @@
+#!/bin/python3
+
+import os
+import time
+import shutil
+import hashlib
+from multiprocessing.pool import ThreadPool
+from PIL import Image, ImageOps
+
+import definitions.layout as layoutdef
+from utils.misc import flatten
+from utils.profiling import profiled
+from utils.monitors import layout_hash, canvas_size
+from definitions.dirs import CANVAS_DIR
+
+"""
+Multi-monitor compositor\n
+Every theme image is composited into one canvas covering whole monitor layout
+(span: one panorama across all outputs, per_output: whole image on every output)
+and GNOME shows the canvas with spanned picture option. Canvases are cached
+as CANVAS_DIR/<layout hash>/<source hash>.jpg, source hash covers image path and
+modification time, so canvases are composited only once per layout change
+"""
+
+CANVAS_QUALITY = 92
+# canvases of layout unused longer than any schedule (dynwallpaper.SCHEDULE_DAYS) are removed,
+# recently used layouts (eg. docked and undocked laptop) stay cached
+MAX_LAYOUT_AGE_SEC = 15 * 24 * 3600
+# decoding and resampling release GIL, threads keep it in process (no fork of GUI process)
+COMPOSITE_THREADS = min(os.cpu_count() or 1, 4)
+
+
+def canvas_path(img_path: str, layout_key: str) -> str:
+    source = f'{os.path.abspath(img_path)}:{os.stat(img_path).st_mtime_ns}'
+    return os.path.join(CANVAS_DIR, layout_key, f'{hashlib.sha1(source.encode()).hexdigest()[:16]}.jpg')
+
+
+def render_canvas(img_path: str, layout: dict) -> Image.Image:
+    size = canvas_size(layout)
+    canvas = Image.new('RGB', size)
+    outputs = layout[layoutdef.OUTPUTS]
+
+    with Image.open(img_path) as img:
+        if layout[layoutdef.MODE] == layoutdef.MODE_SPAN:
+            img.draft('RGB', size)
+            canvas.paste(ImageOps.fit(img.convert('RGB'), size, Image.LANCZOS))
+            return canvas
+
+        largest = max(outputs, key=lambda o: o[layoutdef.OUT_WIDTH] * o[layoutdef.OUT_HEIGHT])
+        img.draft('RGB', (largest[layoutdef.OUT_WIDTH], largest[layoutdef.OUT_HEIGHT]))
+        img = img.convert('RGB')
+
+        # outputs of the same size share one resampled image
+        fitted = {}
+        for o in outputs:
+            output_size = o[layoutdef.OUT_WIDTH], o[layoutdef.OUT_HEIGHT]
+            if output_size not in fitted:
+                fitted[output_size] = ImageOps.fit(img, output_size, Image.LANCZOS)
+            canvas.paste(fitted[output_size], (o[layoutdef.OUT_X], o[layoutdef.OUT_Y]))
+    return canvas
+
+
+def __composite(job: tuple) -> str:
+    img_path, layout, layout_key = job
+    try:
+        path = canvas_path(img_path, layout_key)
+        if os.path.exists(path):
+            return path
+
+        tmp_path = f'{path}.tmp'
+        render_canvas(img_path, layout).save(tmp_path, 'JPEG', quality=CANVAS_QUALITY)
+        os.replace(tmp_path, path)
+        return path
+    except OSError as e:
+        print(f'Cannot composite {img_path}: {e}')
+    return ''
+
+
+def __prune_layouts(layout_key: str):
+    # sessions of the user share CANVAS_DIR, layout dir is removed only when no schedule references it
+    os.utime(os.path.join(CANVAS_DIR, layout_key))
+    expired = time.time() - MAX_LAYOUT_AGE_SEC
+    for d in os.listdir(CANVAS_DIR):
+        dirpath = os.path.join(CANVAS_DIR, d)
+        try:
+            if os.path.getmtime(dirpath) < expired:
+                shutil.rmtree(dirpath, ignore_errors=True)
+        except OSError:
+            pass
+
+
+@profiled()
+def composite_theme(daytime_files: dict, layout: dict) -> dict:
+    '''
+    \nComposite (or take from cache) canvases of all theme images for monitor layout\n
+    Returns: dict( image path -> canvas path ), images which failed are missing
+    '''
+    layout_key = layout_hash(layout)
+    images = sorted(set(flatten(daytime_files.values())))
+    os.makedirs(os.path.join(CANVAS_DIR, layout_key), exist_ok=True)
+
+    with ThreadPool(COMPOSITE_THREADS) as pool:
+        canvases = pool.map(__composite, [(img, layout, layout_key) for img in images])
+
+    __prune_layouts(layout_key)
+    return dict((img, canvas) for img, canvas in zip(images, canvases) if canvas)
@@ -6,11 +6,24 @@ from datetime import datetime, timedelta
 
 import utils.localization as loc
 import utils.solartime as soltime
+import definitions.desktop as desktopdef
 from utils.misc import local_tzoffset
+from utils.profiling import profiled
+from utils.power import on_battery
+from dynwallpaper import DynWallpaper
+from playlist import ThemeRotation
+from utils.luminance import LuminanceIndex
 from gui.appindicator import get_night_mode_status
-from utils.gnome_theming import change_cursor_theme, change_gtk_theme, change_shell_theme
+from utils.monitors import load_layout, layout_hash
+from utils.gnome_theming import change_wallpaper, change_picture_options, PICTURE_SPANNED, PICTURE_ZOOM
+from utils.desktop_profiles import load_profiles, apply_profile
 
 INTERVAL_SEC = 0.5
+INTERVAL_SEC_BATTERY = 5  # longer scheduler slack on battery power
+POWER_POLL_SEC = 30
+LAYOUT_POLL_SEC = 30
+# failed schedule extension is retried after this delay (not on every tick)
+SCHEDULE_RETRY_SEC = 600
 
 
 def in_timeframe(start: datetime, end: datetime) -> bool:
@@ -30,52 +43,167 @@ def get_lightmode_timeframe(lat: float, lon: float) -> tuple:
     return sunrise_dt, evening_dt
 
 
-def loop():
+@profiled()
+def loop(dynwall: DynWallpaper = None, lum_index: LuminanceIndex = None, manage_wallpaper=True,
+         rotation: ThemeRotation = None):
     def current_date() -> tuple:
         dt_timetuple = datetime.now().timetuple()
         return dt_timetuple.tm_year, dt_timetuple.tm_yday
 
-    def change_themes(gtk_theme: str, shell_theme: str, cursor_theme: str) -> None:
-        change_gtk_theme(gtk_theme)
-        time.sleep(0.1)
-        change_cursor_theme(cursor_theme)
-        time.sleep(0.1)
-        change_shell_theme(shell_theme)
+    @profiled('daemon.change_themes')
+    def change_themes(dark: bool) -> None:
+        profile = profiles[desktopdef.PROFILE_DARK if dark else desktopdef.PROFILE_LIGHT]
+        apply_profile(profile)
 
     def change_theme_on_timeframe(start: datetime, end: datetime, is_darkmode: bool, force_refresh=False) -> bool:
         if in_timeframe(start, end):
             if is_darkmode or force_refresh:
-                change_themes(gtk_theme='Pop', shell_theme='Pop',
-                              cursor_theme='xcursor-breeze-snow')
+                change_themes(dark=False)
                 is_darkmode = False
         elif not is_darkmode:
-            change_themes(gtk_theme='Pop-dark', shell_theme='Pop-dark',
-                          cursor_theme='xcursor-breeze')
+            change_themes(dark=True)
             is_darkmode = True
         return is_darkmode
 
+    def change_theme_on_luminance(is_dark_frame: bool, is_darkmode: bool, force_refresh=False) -> bool:
+        if not is_dark_frame:
+            if is_darkmode or force_refresh:
+                change_themes(dark=False)
+                is_darkmode = False
+        elif not is_darkmode or force_refresh:
+            change_themes(dark=True)
+            is_darkmode = True
+        return is_darkmode
+
+    def current_frame_is_dark(was_dark=False):
+        # index lookups of precomputed luminance, images are never analyzed here
+        if dynwall is None or lum_index is None:
+            return None
+        with dynwall.lock():
+            return lum_index.is_dark(dynwall.theme_wallpaper_ontime(datetime.now()),
+                                     dynwall.theme_filelist(), was_dark)
+
+    @profiled('daemon.extend_wallpaper_schedule')
+    def extend_wallpaper_schedule() -> bool:
+        # regenerate multi-day wallpaper schedule before it runs out, returns False on failure
+        if dynwall is None or not manage_wallpaper or not dynwall.schedule_expires_soon():
+            return True
+        with dynwall.lock():
+            try:
+                dynwall.set_timezone_host()
+                dynwall.update_soltime()
+                dynwall.create_wallpaper_xml_files()
+            except Exception as e:
+                # daemon thread must survive, light and dark switching goes on
+                print(f'Cannot extend wallpaper schedule: {e}')
+                return False
+            xmlpath = dynwall.wallpaper_xml_path(low_power=is_low_power)
+            if xmlpath:
+                change_wallpaper(xmlpath)
+                dynwall.remove_stale_xml_files()
+            if dynwall.schedule_expires_soon():
+                print('Cannot extend wallpaper schedule, files were not written')
+                return False
+        return True
+
+    def switch_power_profile(low_power: bool):
+        # both variants are pre-generated, switching is just wallpaper URI change
+        if dynwall is None or not manage_wallpaper:
+            return
+        with dynwall.lock():
+            if dynwall.wallpaper_xml_path(low_power):
+                change_wallpaper(dynwall.wallpaper_xml_path(low_power))
+
+    @profiled('daemon.update_monitor_layout')
+    def update_monitor_layout():
+        # canvases are composited only when layout changes, schedule then references cached canvases
+        if dynwall is None or not manage_wallpaper:
+            return
+        layout = load_layout()
+        if layout_hash(layout) == layout_hash(dynwall.layout()):
+            return
+        if layout is not None:
+            # compositing takes seconds, it runs without lock and schedule below only reads cached canvases
+            dynwall.composite_canvases(layout)
+        with dynwall.lock():
+            dynwall.set_layout(layout)
+            dynwall.create_wallpaper_xml_files()
+            switch_power_profile(is_low_power)
+            dynwall.remove_stale_xml_files()
+        change_picture_options(PICTURE_ZOOM if layout is None else PICTURE_SPANNED)
+
+    @profiled('daemon.rotate_playlist')
+    def rotate_playlist():
+        # upcoming theme is already prepared, rotation only switches wallpaper URI
+        if rotation is None or dynwall is None:
+            return
+        with dynwall.lock():
+            if not rotation.update(dynwall):
+                return
+            switch_power_profile(is_low_power)
+            dynwall.remove_stale_xml_files()
+
+    profiles = load_profiles()
     prev_date = current_date()
-    try:
-        lat, lon = loc.get_geolocation()
-    except loc.EX_RequestTimeout as e:
-        print(e)
-        lat, lon = 0, 0
+    is_low_power = on_battery()
+    power_polled = time.monotonic()
+    layout_polled = time.monotonic()
+    schedule_retry = time.monotonic()
+    # location is already known by dynwall, no need for another Geoclue request
+    if dynwall is not None:
+        summary = dynwall.get_data_summary()
+        lat, lon = summary['lat'], summary['lon']
+    else:
+        try:
+            lat, lon = loc.get_geolocation()
+        except loc.EX_RequestTimeout as e:
+            print(e)
+            lat, lon = 0, 0
     start, end = get_lightmode_timeframe(lat, lon)
-    is_darkmode = change_theme_on_timeframe(
-        start, end, is_darkmode=False, force_refresh=True)
+
+    is_dark_frame = current_frame_is_dark()
+    if is_dark_frame is None:
+        is_darkmode = change_theme_on_timeframe(
+            start, end, is_darkmode=False, force_refresh=True)
+    else:
+        is_darkmode = change_theme_on_luminance(
+            is_dark_frame, is_darkmode=False, force_refresh=True)
 
     while True:
+        if time.monotonic() - power_polled >= POWER_POLL_SEC:
+            power_polled = time.monotonic()
+            if on_battery() != is_low_power:
+                is_low_power = not is_low_power
+                switch_power_profile(is_low_power)
+
+        if time.monotonic() - layout_polled >= LAYOUT_POLL_SEC:
+            layout_polled = time.monotonic()
+            update_monitor_layout()
+
+        rotate_playlist()
+        if time.monotonic() >= schedule_retry and not extend_wallpaper_schedule():
+            print(f'Wallpaper schedule extension is retried in {SCHEDULE_RETRY_SEC // 60} minutes')
+            schedule_retry = time.monotonic() + SCHEDULE_RETRY_SEC
+
         if get_night_mode_status():
             if not is_darkmode:
-                change_themes(gtk_theme='Pop-dark', shell_theme='Pop-dark',
-                              cursor_theme='xcursor-breeze')
+                change_themes(dark=True)
                 is_darkmode = True
         else:
             cur_date = current_date()
             if prev_date != cur_date:
                 start, end = get_lightmode_timeframe(lat, lon)
+                if dynwall is not None:
+                    with dynwall.lock():
+                        dynwall.update_soltime()
                 prev_date = cur_date
 
-            is_darkmode = change_theme_on_timeframe(start, end, is_darkmode)
+            is_dark_frame = current_frame_is_dark(was_dark=is_darkmode)
+            if is_dark_frame is None:
+                is_darkmode = change_theme_on_timeframe(
+                    start, end, is_darkmode)
+            else:
+                is_darkmode = change_theme_on_luminance(
+                    is_dark_frame, is_darkmode)
 
-        time.sleep(INTERVAL_SEC)
+        time.sleep(INTERVAL_SEC_BATTERY if is_low_power else INTERVAL_SEC)
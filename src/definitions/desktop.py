@@ -0,0 +1,11 @@
+#!/bin/python3
+PROFILE_LIGHT = "light"
+PROFILE_DARK = "dark"
+GTK_THEME = "gtk_theme"
+SHELL_THEME = "shell_theme"
+CURSOR_THEME = "cursor_theme"
+ICON_THEME = "icon_theme"
+COLOR_SCHEME = "color_scheme"
+
+PROFILES = PROFILE_LIGHT, PROFILE_DARK
+SETTINGS = GTK_THEME, SHELL_THEME, CURSOR_THEME, ICON_THEME, COLOR_SCHEME
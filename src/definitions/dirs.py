@@ -1,15 +1,26 @@
 #!/bin/python3
+import os
 import os.path
 
 __DEFINITIONS_DIR__ = os.path.dirname(os.path.abspath(__file__))
 SRC_DIR = os.path.dirname(__DEFINITIONS_DIR__)
 ROOT_DIR = os.path.dirname(SRC_DIR)
 THEMES_DIR = os.path.join(ROOT_DIR, 'themes')
-WALLPAPER_XML_DIR = os.path.join(ROOT_DIR, 'wallpaper-xml')
 ICONS_DIR = os.path.join(ROOT_DIR, 'icons')
-CACHE_DIR = os.path.join(ROOT_DIR, 'cache')
+# per-user cache (XDG base directory), installation directory may be shared by several users
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'wallmatic')
+WALLPAPER_XML_DIR = os.path.join(CACHE_DIR, 'wallpaper-xml')
 THUMBNAILS_DIR = os.path.join(CACHE_DIR, 'thumbnails')
+BLOBSTORE_DIR = os.path.join(ROOT_DIR, 'blobstore')
+LUMINANCE_INDEX_FILE = os.path.join(CACHE_DIR, 'luminance-index.json')
+PROFILING_DIR = os.path.join(CACHE_DIR, 'profiling')
+RENDER_OUTPUT_FILE = os.path.join(CACHE_DIR, 'rendered-wallpaper.jpg')
+PLAYLIST_FILE = os.path.join(ROOT_DIR, 'playlist.json')
+DESKTOP_PROFILES_FILE = os.path.join(ROOT_DIR, 'desktop-profiles.json')
+SERVICE_SOCKET_FILE = '/run/wallmatic/schedule.sock'
+MONITOR_LAYOUT_FILE = os.path.join(ROOT_DIR, 'monitor-layout.json')
+CANVAS_DIR = os.path.join(CACHE_DIR, 'canvases')
 
 if __name__ == "__main__":
     print(__DEFINITIONS_DIR__, SRC_DIR, ROOT_DIR,
-          THEMES_DIR, ICONS_DIR, WALLPAPER_XML_DIR, CACHE_DIR, THUMBNAILS_DIR, sep='\n')
+          THEMES_DIR, ICONS_DIR, WALLPAPER_XML_DIR, CACHE_DIR, THUMBNAILS_DIR, LUMINANCE_INDEX_FILE, PROFILING_DIR, RENDER_OUTPUT_FILE, BLOBSTORE_DIR, PLAYLIST_FILE, DESKTOP_PROFILES_FILE, SERVICE_SOCKET_FILE, MONITOR_LAYOUT_FILE, CANVAS_DIR, sep='\n')
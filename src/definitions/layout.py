@@ -0,0 +1,14 @@
+#!/bin/python3
+MODE = "mode"
+OUTPUTS = "outputs"
+OUT_NAME = "name"
+OUT_X = "x"
+OUT_Y = "y"
+OUT_WIDTH = "width"
+OUT_HEIGHT = "height"
+
+MODE_SPAN = "span"
+MODE_PER_OUTPUT = "per_output"
+
+MODES = MODE_SPAN, MODE_PER_OUTPUT
+OUTPUT_GEOMETRY = OUT_X, OUT_Y, OUT_WIDTH, OUT_HEIGHT
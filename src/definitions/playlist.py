@@ -0,0 +1,9 @@
+#!/bin/python3
+ROTATION = "rotation"
+THEMES = "themes"
+ROTATION_DAILY = "daily"
+ROTATION_WEEKLY = "weekly"
+OPTIONAL_SETTINGS = "optional_settings"
+OPT_PRESCALE_IMAGES = "prescale_images"
+
+ROTATION_DAYS = {ROTATION_DAILY: 1, ROTATION_WEEKLY: 7}
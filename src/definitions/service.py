@@ -0,0 +1,18 @@
+#!/bin/python3
+REQUEST = "request"
+REQ_LOCATION = "location"
+REQ_SCHEDULE = "schedule"
+ERROR = "error"
+
+LAT = "lat"
+LON = "lon"
+THEME = "theme"
+TIMEZONE = "timezone"
+TRANSITION_TIME = "transition_time"
+DAYS = "days"
+
+XML_STANDARD = "standard"
+XML_LOW_POWER = "low_power"
+XML_NIGHTMODE = "nightmode"
+SCHEDULE_START = "start"
+SCHEDULE_END = "schedule_end"
@@ -3,15 +3,20 @@
 import os
 import json
 import subprocess
+import threading
 import xml.dom.minidom as dom
 import xml.etree.ElementTree as Et
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import utils.localization as loc
 import utils.solartime as soltime
 import definitions.theme as themedef
+import definitions.service as servicedef
+import utils.schedule_service as schedule_service
+import compositor
 from utils.theme import WallpaperTheme
 from utils.misc import flatten, local_tzoffset
+from utils.profiling import profiled
 from definitions.dirs import WALLPAPER_XML_DIR, THEMES_DIR
 from definitions.version import VERSION, AUTHOR, NAME, GITHUB
 
@@ -22,7 +27,16 @@ DAY_SUNSET_RATIO = 2 / 3
 # total noon duration (in seconds) including transition to daytime wallpaper
 NOON_DURATION = 1800
 
+# number of days covered by generated wallpaper schedule, each day aligned to its own solar times
+SCHEDULE_DAYS = 14
+# schedule is regenerated when less than this amount of days remains
+SCHEDULE_RENEW_MARGIN_DAYS = 2
+
 NIGHTMODE = "NightMode"
+LOW_POWER = "LowPower"
+
+# low power (battery) variant: transitions disabled and at most this amount of wallpapers per daytime
+LOW_POWER_FILES_PER_DAYTIME = 1
 
 # ---------------- Dynamic Wallpaper class --------------------
 
@@ -34,6 +48,20 @@ class DynWallpaper:
         self.__theme = WallpaperTheme()
         self.__sunrise, self.__snoon, self.__sunset, self.__twilight = soltime.timetuple(
             self.__latitude, self.__longitude, self.__timezone)
+        self.__schedule_end = datetime.now()
+        self.__xml_path_standard = ''
+        self.__xml_path_low_power = ''
+        self.__xml_files = []  # files generated by this instance
+        self.__stale_xml_files = []  # replaced files, removed once no longer in use
+        self.__layout = None  # monitor layout, see utils.monitors
+        self.__lock = threading.RLock()
+
+    def lock(self) -> threading.RLock:
+        '''
+        \nInstance is shared by tray (theme switch), daemon and render threads,
+        every sequence of calls which reads or replaces its theme or schedule holds this lock\n
+        '''
+        return self.__lock
 
     def set_geolocation_online(self):
         try:
@@ -61,87 +89,90 @@ class DynWallpaper:
     def set_timezone(self, timezone: float):
         self.__timezone = timezone
 
-    def __calculate_timings(self, transition_time: int, nightmode=False) -> dict:
-        from itertools import repeat
-        timings = dict(zip(themedef.DAYTIMES, repeat([])))
-        sunrise_dur = self.__snoon - self.__sunrise
-        noon_dur = NOON_DURATION
-        twilight_dur = (self.__twilight - self.__sunset)
-        day_dur = (self.__sunset - self.__snoon -
-                   noon_dur) * DAY_SUNSET_RATIO
-        sunset_dur = (self.__sunset - self.__snoon -
-                      noon_dur) - day_dur + twilight_dur
-        night_dur = DAY_LENGTH - sunrise_dur - noon_dur - day_dur - sunset_dur
-
-        if not self.__theme.filelist_sunrise() or nightmode:
-            day_dur += sunrise_dur
-            sunrise_dur = 0
-
-        if not self.__theme.filelist_noon() or nightmode:
-            day_dur += noon_dur
-            noon_dur = 0
-
-        if not self.__theme.filelist_sunset() or nightmode:
-            day_dur += sunset_dur
-            sunset_dur = 0
+    def set_layout(self, layout):
+        '''
+        \nSchedules reference canvases composited for monitor layout (None: theme images directly)\n
+        '''
+        self.__layout = layout
 
-        if nightmode:
-            day_dur += night_dur
-            night_dur = 0
+    def layout(self):
+        return self.__layout
+
+    def __mapped_files(self, files: list, file_map) -> list:
+        if file_map is None:
+            return files
+        return [file_map.get(f, f) for f in files]
 
-        durations = [sunrise_dur, noon_dur, day_dur, sunset_dur, night_dur]
+    def __calculate_timings(self, transition_time: int, nightmode=False, soltimes=None, day_length=DAY_LENGTH, daytime_files=None, warn=True) -> dict:
+        if soltimes is None:
+            soltimes = self.__sunrise, self.__snoon, self.__sunset, self.__twilight
 
         if nightmode:
             daytime_files_amounts = dict([(d, 0) for d in themedef.DAYTIMES])
             daytime_files_amounts[themedef.FL_DAY] = len(
                 self.__theme.filelist_night())
         else:
-            daytime_files = self.__theme.filelist_all()
+            if daytime_files is None:
+                daytime_files = self.__theme.filelist_all()
             daytime_files_amounts = dict(
                 [(d, len(daytime_files[d])) for d in daytime_files])
 
-        for i, daytime in enumerate(themedef.DAYTIMES):
-            if durations[i] == 0:
-                timings[daytime] = []
-                continue
-
-            trans_time = transition_time
-            if trans_time * daytime_files_amounts[daytime] >= durations[i]:
-                print(
-                    f'WARNING: Transitions take longer than duration of {daytime}! Fixing timings...')
-                trans_time = (
-                    durations[i] - daytime_files_amounts[daytime]) // daytime_files_amounts[daytime]
-
-            sub_dur = durations[i] - trans_time * \
-                daytime_files_amounts[daytime]
-            static_dur = [sub_dur // daytime_files_amounts[daytime]
-                          for _ in range(daytime_files_amounts[daytime])]
-
-            # fix static time
-            if sum(static_dur) != sub_dur:
-                static_dur.append(sub_dur - sum(static_dur) + static_dur.pop())
-
-            timings[daytime] = [(x, trans_time) for x in static_dur]
+        timings = calculate_timings(
+            transition_time, soltimes, day_length, daytime_files_amounts, nightmode, warn)
 
         validation_sum = sum(flatten(flatten(timings.values())))
-        if validation_sum != DAY_LENGTH:
+        if validation_sum != day_length:
             raise Exception(
-                f"Total animation length does not equal 24 hours! It is: {validation_sum}, should be {DAY_LENGTH}")
+                f"Total animation length does not equal day length! It is: {validation_sum}, should be {day_length}")
 
         return timings
 
-    def __generate_xml_string(self, daytime_files: dict, timings: dict, disable_transitions=False) -> str:
+    def __calculate_schedule(self, transition_time: int, start_date: datetime, days: int, daytime_files=None) -> list:
+        '''
+        \nCalculate timings for consecutive days starting at sunrise of start_date\n
+        Every day lasts from its own sunrise until sunrise of the next day\n
+        Returns: list of timings dicts (one per day)
+        '''
+        soltimes = [soltime.timetuple(self.__latitude, self.__longitude, self.__timezone,
+                                      start_date + timedelta(days=i)) for i in range(days + 1)]
+        schedule = []
+        for i in range(days):
+            day_length = DAY_LENGTH + soltimes[i + 1][0] - soltimes[i][0]
+            schedule.append(self.__calculate_timings(
+                transition_time, soltimes=soltimes[i], day_length=day_length, daytime_files=daytime_files))
+        return schedule
+
+    def __sunrise_datetime(self, date: datetime) -> datetime:
+        sunrise = soltime.timetuple(
+            self.__latitude, self.__longitude, self.__timezone, date)[0]
+        return date + timedelta(seconds=sunrise)
+
+    def __generate_xml_string(self, daytime_files: dict, schedule: list, disable_transitions=False, start=None) -> str:
         root = Et.Element("background")
         start_time = Et.SubElement(root, "starttime")
 
-        Et.SubElement(start_time, "year").text = "2020"
-        Et.SubElement(start_time, "month").text = "1"
-        Et.SubElement(start_time, "day").text = "1"
-        Et.SubElement(start_time, "hour").text = f"{self.__sunrise // 3600}"
-        Et.SubElement(
-            start_time, "minute").text = f"{(self.__sunrise % 3600) // 60}"
+        if start is None:
+            # single looped day, start date is irrelevant
+            start = datetime(2020, 1, 1) + timedelta(seconds=self.__sunrise)
+
+        Et.SubElement(start_time, "year").text = f"{start.year}"
+        Et.SubElement(start_time, "month").text = f"{start.month}"
+        Et.SubElement(start_time, "day").text = f"{start.day}"
+        Et.SubElement(start_time, "hour").text = f"{start.hour}"
+        Et.SubElement(start_time, "minute").text = f"{start.minute}"
         Et.SubElement(start_time, "second").text = "0"
 
+        for timings in schedule:
+            self.__append_xml_day(
+                root, daytime_files, timings, disable_transitions)
+
+        xml_header = dom.Document().toxml()
+        xml_str = dom.parseString(Et.tostring(root)).toprettyxml(
+            indent="   ")[len(xml_header) + 1:]
+
+        return xml_str
+
+    def __append_xml_day(self, root: Et.Element, daytime_files: dict, timings: dict, disable_transitions=False):
         for count, daytime in enumerate(themedef.DAYTIMES):
             for index, wallpaper in enumerate(daytime_files[daytime]):
                 # static background
@@ -170,12 +201,6 @@ class DynWallpaper:
 
                     Et.SubElement(tmp, "to").text = next_wallpaper
 
-        xml_header = dom.Document().toxml()
-        xml_str = dom.parseString(Et.tostring(root)).toprettyxml(
-            indent="   ")[len(xml_header) + 1:]
-
-        return xml_str
-
     def __create_xml_file(self, xml_string: str, xml_filename: str) -> str:
         try:
             xml_path = os.path.join(WALLPAPER_XML_DIR, xml_filename)
@@ -193,49 +218,168 @@ class DynWallpaper:
 
         return ""
 
-    def create_wallpaper_xml_files(self, transition_time=600) -> tuple:
+    def __preferred_transition_time(self, transition_time: int) -> int:
         opt_sett = self.__theme.optional_settings()
         if themedef.OPT_PREF_TRANSITION_DURATION in opt_sett:
-            transition_time = opt_sett[themedef.OPT_PREF_TRANSITION_DURATION]
-        timestamp = int(datetime.now().timestamp())
-
-        # standard wallpaper theme
-        timings_standard = self.__calculate_timings(transition_time)
+            return opt_sett[themedef.OPT_PREF_TRANSITION_DURATION]
+        return transition_time
+
+    def generate_wallpaper_xml(self, transition_time=600, days=SCHEDULE_DAYS, now=None, file_map=None) -> dict:
+        '''
+        \nGenerate standard, low power and night mode schedules without writing any files\n
+        now: local time of schedule timezone (default: host time)\n
+        file_map: optional dict( theme image path -> path used in schedule )\n
+        Returns: dict with XML strings and schedule start/end (ISO format), see definitions.service
+        '''
+        transition_time = self.__preferred_transition_time(transition_time)
+        if now is None:
+            now = datetime.now()
+
+        # standard wallpaper theme, every day follows its own sunrise and sunset
+        start_date = datetime(now.year, now.month, now.day)
+        start = self.__sunrise_datetime(start_date)
+        if now < start:
+            start_date -= timedelta(days=1)
+            start = self.__sunrise_datetime(start_date)
+
+        daytime_files = dict((d, self.__mapped_files(f, file_map))
+                             for d, f in self.__theme.filelist_all().items())
+        night_files = self.__mapped_files(self.__theme.filelist_night(), file_map)
+
+        schedule = self.__calculate_schedule(
+            transition_time, start_date, days)
         xml_standard = self.__generate_xml_string(
-            self.__theme.filelist_all(), timings_standard)
-        xml_standard_name = f'{NAME}-{timestamp}.xml'
+            daytime_files, schedule, start=start)
+
+        # low power wallpaper theme, generated upfront so switching power source is just URI change
+        daytimes_low_power = low_power_filelist(daytime_files)
+        schedule_low_power = self.__calculate_schedule(
+            0, start_date, days, daytime_files=daytimes_low_power)
+        xml_low_power = self.__generate_xml_string(
+            daytimes_low_power, schedule_low_power, disable_transitions=True, start=start)
 
         # night mode wallpaper theme
         daytimes_nightmode = dict([(d, []) for d in themedef.DAYTIMES])
-        daytimes_nightmode[themedef.FL_DAY] = self.__theme.filelist_night()
+        daytimes_nightmode[themedef.FL_DAY] = night_files
 
-        if len(self.__theme.filelist_night()) == 1:
+        if len(night_files) == 1:
             timings_nightmode = self.__calculate_timings(0, nightmode=True)
             xml_nightmode = self.__generate_xml_string(
-                daytimes_nightmode, timings_nightmode, disable_transitions=True)
+                daytimes_nightmode, [timings_nightmode], disable_transitions=True)
         else:
             timings_nightmode = self.__calculate_timings(
                 transition_time, nightmode=True)
             xml_nightmode = self.__generate_xml_string(
-                daytimes_nightmode, timings_nightmode)
+                daytimes_nightmode, [timings_nightmode])
+
+        schedule_end = start + timedelta(
+            seconds=sum(sum(flatten(flatten(t.values()))) for t in schedule))
+
+        return {servicedef.XML_STANDARD: xml_standard, servicedef.XML_LOW_POWER: xml_low_power,
+                servicedef.XML_NIGHTMODE: xml_nightmode, servicedef.SCHEDULE_START: start.isoformat(),
+                servicedef.SCHEDULE_END: schedule_end.isoformat()}
+
+    @profiled()
+    def create_wallpaper_xml_files(self, transition_time=600, days=SCHEDULE_DAYS) -> tuple:
+        # schedule of shared system service (if running) is only written into user's directory
+        xml = None
+        if self.__layout is not None:
+            # canvases depend on monitor layout of this session, schedule is generated locally
+            canvases = self.composite_canvases(self.__layout)
+            xml = self.generate_wallpaper_xml(
+                transition_time, days, file_map=canvases)
+        elif schedule_service.enabled():
+            xml = schedule_service.fetch_schedule(
+                self.__theme.dirpath(), self.__timezone, transition_time, days)
+        if xml is None:
+            xml = self.generate_wallpaper_xml(transition_time, days)
 
-        xml_nightmode_name = f'{NAME}-{NIGHTMODE}-{timestamp}.xml'
+        timestamp = int(datetime.now().timestamp())
+        theme_name = os.path.basename(self.__theme.dirpath())
+        xml_standard_name = f'{NAME}-{theme_name}-{timestamp}.xml'
+        xml_low_power_name = f'{NAME}-{theme_name}-{LOW_POWER}-{timestamp}.xml'
+        xml_nightmode_name = f'{NAME}-{theme_name}-{NIGHTMODE}-{timestamp}.xml'
 
-        if os.path.exists(WALLPAPER_XML_DIR):
-            clear_wallpaper_xml_dir()
-        else:
-            os.mkdir(WALLPAPER_XML_DIR)
+        # only files of this instance are replaced, other schedules (eg. prepared playlist theme) stay intact
+        try:
+            os.makedirs(WALLPAPER_XML_DIR, exist_ok=True)
+        except OSError as e:
+            print(f'Cannot create directory: {WALLPAPER_XML_DIR}, {e.strerror}')
+            return '', ''
+
+        # replaced files may still be shown, caller removes them after switching wallpaper
+        self.__stale_xml_files += self.__xml_files
+        self.__xml_files = []
 
         # save themes to files
         xml_nightmode_path = self.__create_xml_file(
-            xml_nightmode, xml_nightmode_name)
+            xml[servicedef.XML_NIGHTMODE], xml_nightmode_name)
         xml_standard_path = self.__create_xml_file(
-            xml_standard, xml_standard_name)
+            xml[servicedef.XML_STANDARD], xml_standard_name)
+        xml_low_power_path = self.__create_xml_file(
+            xml[servicedef.XML_LOW_POWER], xml_low_power_name)
+
+        self.__xml_path_standard = xml_standard_path
+        self.__xml_path_low_power = xml_low_power_path or xml_standard_path
+        self.__xml_files = [p for p in (xml_standard_path, xml_low_power_path, xml_nightmode_path) if p]
+
+        self.__schedule_end = datetime.fromisoformat(xml[servicedef.SCHEDULE_END])
 
         return xml_standard_path, xml_nightmode_path
 
+    def composite_canvases(self, layout) -> dict:
+        '''
+        \nComposite (or take from cache) canvases of theme images for monitor layout\n
+        Returns: dict( image path -> canvas path ), see compositor.composite_theme()
+        '''
+        return compositor.composite_theme(self.__theme.filelist_all(), layout)
+
+    def wallpaper_xml_path(self, low_power=False) -> str:
+        if low_power:
+            return self.__xml_path_low_power
+        return self.__xml_path_standard
+
+    def adopt(self, other: 'DynWallpaper'):
+        '''
+        \nTake over theme, monitor layout and already generated schedule files of other instance\n
+        Files generated so far by this instance become stale, see remove_stale_xml_files()
+        '''
+        with self.__lock:
+            self.__theme = other.__theme
+            self.__layout = other.__layout
+            self.__xml_path_standard = other.__xml_path_standard
+            self.__xml_path_low_power = other.__xml_path_low_power
+            self.__schedule_end = other.__schedule_end
+            self.__stale_xml_files += self.__xml_files
+            self.__xml_files = other.__xml_files
+            other.__xml_files = []
+
+    def remove_xml_files(self):
+        self.__stale_xml_files += self.__xml_files
+        self.__xml_files = []
+        self.__xml_path_standard = ''
+        self.__xml_path_low_power = ''
+        self.remove_stale_xml_files()
+
+    def remove_stale_xml_files(self):
+        for xmlf in set(self.__stale_xml_files) - set(self.__xml_files):
+            try:
+                os.remove(xmlf)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f'Error: {xmlf}, {e.strerror}')
+        self.__stale_xml_files = []
+
+    def schedule_end(self) -> datetime:
+        return self.__schedule_end
+
+    def schedule_expires_soon(self, margin_days=SCHEDULE_RENEW_MARGIN_DAYS) -> bool:
+        return datetime.now() + timedelta(days=margin_days) >= self.__schedule_end
+
     def theme_wallpaper_ontime(self, date: datetime) -> str:
-        timings = self.__calculate_timings(0)
+        # called every daemon tick, timing warnings are printed when schedule is generated
+        timings = self.__calculate_timings(0, warn=False)
         day_sec = (date - datetime(date.year, date.month, date.day)
                    ).total_seconds()
         index = -1
@@ -250,6 +394,33 @@ class DynWallpaper:
 
         return flatten(self.__theme.filelist_all().values())[index]
 
+    def theme_filelist(self) -> dict:
+        return self.__theme.filelist_all()
+
+    def theme_frame_ontime(self, date: datetime, transition_time=600) -> tuple:
+        '''
+        \nFind wallpapers shown at given time, including overlay transition progress\n
+        Returns: tuple( from_wallpaper: str, to_wallpaper: str, progress: float (0.0 - 1.0) )
+        '''
+        transition_time = self.__preferred_transition_time(transition_time)
+        timings = flatten(self.__calculate_timings(
+            transition_time, warn=False).values())
+        files = flatten(self.__theme.filelist_all().values())
+
+        day_sec = (date - datetime(date.year, date.month, date.day)
+                   ).total_seconds()
+        offset = (day_sec - self.__sunrise) % DAY_LENGTH
+
+        for index, (static_dur, trans_dur) in enumerate(timings):
+            if offset < static_dur:
+                return files[index], files[index], 0.0
+            offset -= static_dur
+            if offset < trans_dur:
+                return files[index], files[(index + 1) % len(files)], offset / trans_dur
+            offset -= trans_dur
+
+        return files[-1], files[-1], 0.0
+
     def get_data_summary(self):
         return {'lat': self.__latitude, 'lon': self.__longitude, 'timezone': self.__timezone, 'sunrise': self.__sunrise,
                 'snoon': self.__snoon, 'sunset': self.__sunset, 'theme': self.__theme.title()}
@@ -257,6 +428,86 @@ class DynWallpaper:
 
 # ----------------------- Other --------------------------------
 
+def calculate_timings(transition_time: int, soltimes: tuple, day_length: int, daytime_files_amounts: dict, nightmode=False, warn=True) -> dict:
+    '''
+    \nSplit one day (sunrise to next sunrise) between daytimes and their wallpapers\n
+    soltimes: tuple( sunrise, solar noon, sunset, civil twilight ) in seconds\n
+    warn: print warning when transitions are shortened to fit daytime\n
+    Returns: dict( daytime -> list of tuple( static duration, transition duration ) )
+    '''
+    from itertools import repeat
+    sunrise, snoon, sunset, twilight = soltimes
+
+    timings = dict(zip(themedef.DAYTIMES, repeat([])))
+    sunrise_dur = snoon - sunrise
+    noon_dur = NOON_DURATION
+    twilight_dur = (twilight - sunset)
+    day_dur = (sunset - snoon -
+               noon_dur) * DAY_SUNSET_RATIO
+    sunset_dur = (sunset - snoon -
+                  noon_dur) - day_dur + twilight_dur
+    night_dur = day_length - sunrise_dur - noon_dur - day_dur - sunset_dur
+
+    if not daytime_files_amounts[themedef.FL_SUNRISE] or nightmode:
+        day_dur += sunrise_dur
+        sunrise_dur = 0
+
+    if not daytime_files_amounts[themedef.FL_NOON] or nightmode:
+        day_dur += noon_dur
+        noon_dur = 0
+
+    if not daytime_files_amounts[themedef.FL_SUNSET] or nightmode:
+        day_dur += sunset_dur
+        sunset_dur = 0
+
+    if nightmode:
+        day_dur += night_dur
+        night_dur = 0
+
+    durations = [sunrise_dur, noon_dur, day_dur, sunset_dur, night_dur]
+
+    for i, daytime in enumerate(themedef.DAYTIMES):
+        if durations[i] == 0:
+            timings[daytime] = []
+            continue
+
+        trans_time = transition_time
+        if trans_time * daytime_files_amounts[daytime] >= durations[i]:
+            if warn:
+                print(
+                    f'WARNING: Transitions take longer than duration of {daytime}! Fixing timings...')
+            trans_time = (
+                durations[i] - daytime_files_amounts[daytime]) // daytime_files_amounts[daytime]
+
+        sub_dur = durations[i] - trans_time * \
+            daytime_files_amounts[daytime]
+        static_dur = [sub_dur // daytime_files_amounts[daytime]
+                      for _ in range(daytime_files_amounts[daytime])]
+
+        # fix static time
+        if sum(static_dur) != sub_dur:
+            static_dur.append(sub_dur - sum(static_dur) + static_dur.pop())
+
+        timings[daytime] = [(x, trans_time) for x in static_dur]
+
+    return timings
+
+
+def low_power_filelist(daytime_files: dict) -> dict:
+    '''
+    \nReduce every daytime to at most LOW_POWER_FILES_PER_DAYTIME evenly spaced wallpapers\n
+    '''
+    reduced = {}
+    for daytime, files in daytime_files.items():
+        if len(files) <= LOW_POWER_FILES_PER_DAYTIME:
+            reduced[daytime] = list(files)
+            continue
+        step = len(files) / LOW_POWER_FILES_PER_DAYTIME
+        reduced[daytime] = [files[int(step * i + step / 2)]
+                            for i in range(LOW_POWER_FILES_PER_DAYTIME)]
+    return reduced
+
+
 def clear_wallpaper_xml_dir():
     if os.path.exists(WALLPAPER_XML_DIR):
         files = [os.path.join(WALLPAPER_XML_DIR, f)
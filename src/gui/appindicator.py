@@ -1,12 +1,16 @@
 #!/bin/python3
 import os
 import signal
+import threading
 from gi import require_versions
 
-from definitions.dirs import ICONS_DIR
+from definitions.dirs import ICONS_DIR, THEMES_DIR
+import gui.thumbnails as thumbnails
 
-require_versions({'Gtk': '3.0', 'AppIndicator3': '0.1', 'Notify': '0.7'})
+require_versions({'Gtk': '3.0', 'AppIndicator3': '0.1', 'Notify': '0.7', 'GdkPixbuf': '2.0'})
 from gi.repository import Gtk as gtk
+from gi.repository import GdkPixbuf as gdkpixbuf
+from gi.repository import GLib as glib
 from gi.repository import AppIndicator3 as appindicator
 from gi.repository import Notify as notify
 
@@ -18,6 +22,7 @@ TASKBAR_ICON_PATH_DARK = os.path.join(
 
 LABEL_ENABLE_NIGHT_MODE = "Enable Night Mode"
 LABEL_DISABLE_NIGHT_MODE = "Disable Night Mode"
+LABEL_THEMES = "Themes"
 LABEL_QUIT = "Quit"
 
 ################################### global variables ####################################
@@ -27,11 +32,21 @@ __AppIndicator = appindicator.Indicator.new(
 
 __night_mode_status = False
 
+# called (in worker thread) with theme directory path when theme is picked from menu, returns True on success
+__theme_selected_callback = None
+# theme switches run one at a time outside GTK main loop (canvas compositing takes seconds)
+__theme_switch_lock = threading.Lock()
+
 
 def get_night_mode_status() -> bool:
     global __night_mode_status
     return __night_mode_status
 
+
+def set_theme_selected_callback(callback) -> None:
+    global __theme_selected_callback
+    __theme_selected_callback = callback
+
 #########################################################################################
 
 
@@ -50,12 +65,66 @@ def build_menu():
     item_quit.connect('activate', quit)
     item_night_mode = gtk.MenuItem(label=LABEL_ENABLE_NIGHT_MODE)
     item_night_mode.connect('activate', night_mode)
+    item_themes = gtk.MenuItem(label=LABEL_THEMES)
+    item_themes.set_submenu(build_themes_menu())
+    menu.append(item_themes)
     menu.append(item_night_mode)
     menu.append(item_quit)
     menu.show_all()
     return menu
 
 
+def build_themes_menu():
+    submenu = gtk.Menu()
+    index = thumbnails.load_thumbnail_atlas_index()
+    themes = index.get(thumbnails.ATLAS_THEMES, {})
+
+    # single decode of pre-built atlas, thumbnails are views into its pixels
+    try:
+        atlas = gdkpixbuf.Pixbuf.new_from_file(thumbnails.ATLAS_FILE)
+    except glib.Error:
+        atlas = None
+
+    for theme_dir in sorted(themes):
+        entry = themes[theme_dir]
+        item = gtk.ImageMenuItem(label=entry[thumbnails.ATLAS_TITLE])
+        if atlas is not None:
+            thumbnail = atlas.new_subpixbuf(entry[thumbnails.ATLAS_X], entry[thumbnails.ATLAS_Y],
+                                            entry[thumbnails.ATLAS_WIDTH], entry[thumbnails.ATLAS_HEIGHT])
+            item.set_image(gtk.Image.new_from_pixbuf(thumbnail))
+            item.set_always_show_image(True)
+        item.connect('activate', select_theme, os.path.join(THEMES_DIR, theme_dir))
+        submenu.append(item)
+
+    return submenu
+
+
+def select_theme(item: gtk.MenuItem, theme_dirpath: str):
+    global __theme_selected_callback
+
+    if __theme_selected_callback is None:
+        return
+
+    threading.Thread(target=switch_theme, args=(
+        __theme_selected_callback, theme_dirpath, item.get_label()), daemon=True).start()
+
+
+def switch_theme(callback, theme_dirpath: str, label: str):
+    global __theme_switch_lock
+
+    with __theme_switch_lock:
+        switched = callback(theme_dirpath)
+    if switched:
+        # notification is shown from GTK main loop
+        glib.idle_add(notify_theme_switched, label)
+
+
+def notify_theme_switched(label: str) -> bool:
+    notify.Notification.new(
+        APPINDICATOR_ID, f'Wallpaper theme: {label}', None).show()
+    return False
+
+
 def quit(_):
     notify.uninit()
     gtk.main_quit()
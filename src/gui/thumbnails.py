@@ -1,15 +1,31 @@
 #!/bin/python3
 
 import os
+import json
+import hashlib
 from PIL import Image
 
 import definitions.theme as themedef
-from utils.theme import list_valid_themes, WallpaperTheme
+from utils.theme import list_valid_themes, WallpaperTheme, THEME_FILE
 from definitions.dirs import THEMES_DIR, ROOT_DIR, THUMBNAILS_DIR
 
 THUMBNAIL_SIZE = (512, 288)
 THUMBNAIL_CROP_BOX = (256, 0, 512, 288)
 
+# sprite atlas of all theme thumbnails (used by theme picker menu)
+ATLAS_CELL_SIZE = (128, 72)
+ATLAS_COLUMNS = 8
+ATLAS_FILE = os.path.join(THUMBNAILS_DIR, 'atlas.jpg')
+ATLAS_INDEX_FILE = os.path.join(THUMBNAILS_DIR, 'atlas.json')
+
+ATLAS_SIGNATURE = "signature"
+ATLAS_THEMES = "themes"
+ATLAS_TITLE = "title"
+ATLAS_X = "x"
+ATLAS_Y = "y"
+ATLAS_WIDTH = "width"
+ATLAS_HEIGHT = "height"
+
 
 def generate_thumbnails():
     themes = list_valid_themes()
@@ -38,3 +54,102 @@ def generate_thumbnails():
             img_day.save(outfile, "JPEG")
         except IOError:
             print("Cannot create thumbnail for:", outfile)
+
+
+def render_thumbnail(theme: WallpaperTheme, size: tuple) -> Image.Image:
+    '''
+    \nRender thumbnail with left half of day wallpaper and right half of night wallpaper\n
+    Throws exception: IOError when wallpapers cannot be read
+    '''
+    with Image.open(theme.filelist_day()[0]) as img_day:
+        img_day.draft('RGB', size)
+        thumbnail = img_day.convert('RGB').resize(size)
+    with Image.open(theme.filelist_night()[0]) as img_night:
+        img_night.draft('RGB', size)
+        img_night = img_night.convert('RGB').resize(size)
+
+    crop_box = (size[0] // 2, 0, size[0], size[1])
+    thumbnail.paste(img_night.crop(crop_box), crop_box)
+    return thumbnail
+
+
+def catalog_signature(themes: list) -> str:
+    '''
+    \nHash of theme catalog: theme directories, their theme.json files
+    and thumbnail source images (names and modification times)\n
+    '''
+    digest = hashlib.sha1()
+    for theme_dir in sorted(themes):
+        theme_abspath = os.path.join(THEMES_DIR, theme_dir)
+        theme = WallpaperTheme()
+        theme.open(theme_abspath)
+        sources = [os.path.join(theme_abspath, THEME_FILE)] + \
+            theme.filelist_day()[:1] + theme.filelist_night()[:1]
+        for path in sources:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                mtime = 0
+            digest.update(f'{path}:{mtime};'.encode())
+    return digest.hexdigest()
+
+
+def load_thumbnail_atlas_index() -> dict:
+    try:
+        with open(ATLAS_INDEX_FILE, 'r') as f:
+            return json.load(f)
+    except IOError:
+        pass
+    except json.JSONDecodeError:
+        print("Error occurred while trying to parse JSON file: ", ATLAS_INDEX_FILE)
+    return {}
+
+
+def generate_thumbnail_atlas(force=False) -> dict:
+    '''
+    \nBuild single sprite atlas image with thumbnails of all valid themes
+    and JSON index of their offsets. Atlas is rebuilt only when theme catalog changes\n
+    Returns: atlas index dict (empty on failure)
+    '''
+    themes = sorted(list_valid_themes())
+    signature = catalog_signature(themes)
+
+    index = load_thumbnail_atlas_index()
+    if not force and index.get(ATLAS_SIGNATURE) == signature and os.path.exists(ATLAS_FILE):
+        return index
+
+    cell_w, cell_h = ATLAS_CELL_SIZE
+    columns = max(1, min(len(themes), ATLAS_COLUMNS))
+    rows = max(1, -(-len(themes) // ATLAS_COLUMNS))
+    atlas = Image.new('RGB', (cell_w * columns, cell_h * rows))
+    index = {ATLAS_SIGNATURE: signature, ATLAS_THEMES: {}}
+
+    cell = 0
+    for theme_dir in themes:
+        theme = WallpaperTheme()
+        if not theme.open(os.path.join(THEMES_DIR, theme_dir)):
+            continue
+        try:
+            thumbnail = render_thumbnail(theme, ATLAS_CELL_SIZE)
+        except IOError:
+            print("Cannot create thumbnail for:", theme_dir)
+            continue
+
+        x, y = (cell % ATLAS_COLUMNS) * cell_w, (cell // ATLAS_COLUMNS) * cell_h
+        atlas.paste(thumbnail, (x, y))
+        index[ATLAS_THEMES][theme_dir] = {ATLAS_TITLE: theme.title(), ATLAS_X: x, ATLAS_Y: y,
+                                          ATLAS_WIDTH: cell_w, ATLAS_HEIGHT: cell_h}
+        cell += 1
+
+    try:
+        os.makedirs(THUMBNAILS_DIR, exist_ok=True)
+        atlas.save(f'{ATLAS_FILE}.tmp', "JPEG", quality=90)
+        os.replace(f'{ATLAS_FILE}.tmp', ATLAS_FILE)
+        with open(f'{ATLAS_INDEX_FILE}.tmp', 'w') as f:
+            json.dump(index, f, indent=4)
+        os.replace(f'{ATLAS_INDEX_FILE}.tmp', ATLAS_INDEX_FILE)
+    except IOError:
+        print("Cannot create thumbnail atlas:", ATLAS_FILE)
+        return {}
+
+    return index
@@ -0,0 +1,255 @@
+#!/bin/python3
+
+import os
+import re
+import json
+import time
+import shutil
+from datetime import datetime
+from multiprocessing import Pool
+from PIL import Image, ImageOps
+
+import definitions.theme as themedef
+from dynwallpaper import DynWallpaper, DAY_LENGTH
+from utils.theme import THEME_FILE, WallpaperTheme
+from utils.luminance import analyze_image, DARK_THRESHOLD, KEY_LUMINANCE
+from definitions.dirs import THEMES_DIR
+
+"""
+Theme import pipeline\n
+Builds theme directory (normalised images and theme.json) from a folder of images,
+eg. frames of a day timelapse. Images are analyzed and normalised in parallel by
+a process pool, only the ordering and phase assignment run in the main process
+"""
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff', '.bmp')
+
+IMPORT_SIZE = (3840, 2160)
+IMPORT_QUALITY = 90
+
+# transition duration used by schedule unless theme prefers another one
+DEFAULT_TRANSITION_TIME = 600
+
+ORDER_AUTO = 'auto'
+ORDER_EXIF = 'exif'
+ORDER_BRIGHTNESS = 'brightness'
+ORDER_NAME = 'name'
+ORDERS = ORDER_AUTO, ORDER_EXIF, ORDER_BRIGHTNESS, ORDER_NAME
+
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+EXIF_DATETIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+KEY_PATH = 'path'
+KEY_CAPTURED = 'captured'
+
+
+def __capture_time(img: Image.Image):
+    exif = img.getexif()
+    value = exif.get_ifd(EXIF_IFD).get(
+        EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    try:
+        return datetime.strptime(str(value).strip('\x00 '), EXIF_DATETIME_FORMAT).isoformat()
+    except ValueError:
+        return None
+
+
+def __analyze(img_path: str):
+    # worker: EXIF is read from header only, pixels are decoded at reduced scale by analyze_image
+    try:
+        with Image.open(img_path) as img:
+            captured = __capture_time(img)
+        stats = analyze_image(img_path)
+    except (OSError, SyntaxError) as e:
+        print(f'Skipping {img_path}: {e}')
+        return None
+    return {KEY_PATH: img_path, KEY_CAPTURED: captured, KEY_LUMINANCE: stats[KEY_LUMINANCE]}
+
+
+def __normalise(job: tuple) -> bool:
+    # worker: decode (JPEG draft mode) just above target size, crop to target aspect ratio and re-encode
+    src_path, dst_path, size, quality = job
+    try:
+        with Image.open(src_path) as img:
+            img.draft('RGB', size)
+            img = ImageOps.exif_transpose(img).convert('RGB')
+            img = ImageOps.fit(img, size, Image.LANCZOS)
+            img.save(dst_path, 'JPEG', quality=quality, optimize=True)
+        return True
+    except OSError as e:
+        print(f'Cannot convert {src_path}: {e}')
+    return False
+
+
+def list_images(folder: str) -> list:
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                  if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def order_images(images: list, order=ORDER_AUTO) -> list:
+    '''
+    \nOrder analyzed images as one day cycle\n
+    exif: by capture time, brightness: dark - bright - dark (for unrelated photos),
+    name: by filename, auto: exif if every image has capture time, otherwise brightness
+    '''
+    if order == ORDER_AUTO:
+        order = ORDER_EXIF if all(i[KEY_CAPTURED] for i in images) else ORDER_BRIGHTNESS
+
+    if order == ORDER_EXIF:
+        missing = [i[KEY_PATH] for i in images if not i[KEY_CAPTURED]]
+        if missing:
+            print(f'WARNING: no EXIF capture time in {len(missing)} images, they are ordered by filename')
+        return sorted(images, key=lambda i: (i[KEY_CAPTURED] or '', i[KEY_PATH]))
+
+    if order == ORDER_BRIGHTNESS:
+        ascending = sorted(images, key=lambda i: i[KEY_LUMINANCE])
+        return ascending[0::2] + ascending[1::2][::-1]
+
+    return sorted(images, key=lambda i: i[KEY_PATH])
+
+
+def assign_daytimes(luminance: list) -> dict:
+    '''
+    \nSplit day cycle (list of image luminances) into daytimes\n
+    Longest run of dark images becomes night and cycle is rotated so it starts right after it,
+    brightest image becomes noon, images before it sunrise, images after it day until
+    brightness drops below half way to dark threshold, the rest sunset\n
+    Returns: dict( daytime -> list of indexes into luminance list )
+    '''
+    count = len(luminance)
+    dark = [lum < DARK_THRESHOLD for lum in luminance]
+
+    # longest circular run of dark images, without any the darkest image is night
+    night_end, night_len = min(range(count), key=lambda i: luminance[i]), 1
+    run = 0
+    for i in range(2 * count):
+        run = run + 1 if dark[i % count] else 0
+        if night_len < run <= count:
+            night_end, night_len = i % count, run
+    night_len = min(night_len, count - 1)
+
+    cycle = [(night_end + 1 + i) % count for i in range(count)]
+    lit, night = cycle[:count - night_len], cycle[count - night_len:]
+
+    peak = max(range(len(lit)), key=lambda i: luminance[lit[i]])
+    midpoint = DARK_THRESHOLD + (luminance[lit[peak]] - DARK_THRESHOLD) / 2
+    after = lit[peak + 1:]
+    day_len = next((i for i, idx in enumerate(after)
+                    if luminance[idx] < midpoint), len(after))
+
+    daytimes = {themedef.FL_SUNRISE: lit[:peak], themedef.FL_NOON: [lit[peak]],
+                themedef.FL_DAY: after[:day_len], themedef.FL_SUNSET: after[day_len:],
+                themedef.FL_NIGHT: night}
+
+    # day is the only daytime which is never skipped by schedule, so it must not be empty
+    if not daytimes[themedef.FL_DAY]:
+        daytimes[themedef.FL_DAY], daytimes[themedef.FL_NOON] = daytimes[themedef.FL_NOON], []
+    return daytimes
+
+
+def validate_theme(theme_dirpath: str) -> bool:
+    '''
+    \nOpen theme, check that every listed image exists and that one day schedule can be generated\n
+    '''
+    theme = WallpaperTheme()
+    if not theme.open(theme_dirpath):
+        return False
+    missing = [f for files in theme.filelist_all().values()
+               for f in files if not os.path.isfile(f)]
+    if missing or not theme.filelist_day() or not theme.filelist_night():
+        print(f'Invalid theme, missing images: {missing}')
+        return False
+
+    dynwall = DynWallpaper()
+    if not dynwall.set_theme(theme_dirpath):
+        return False
+    try:
+        dynwall.generate_wallpaper_xml(days=1)
+    except Exception as e:
+        print(f'Invalid theme, {e}')
+        return False
+    return True
+
+
+def import_theme(folder: str, name='', title='', order=ORDER_AUTO, size=IMPORT_SIZE,
+                 quality=IMPORT_QUALITY, workers=None) -> str:
+    '''
+    \nCreate theme THEMES_DIR/name from images in folder (name defaults to folder name)\n
+    Theme directory is built under temporary name and renamed when it is valid\n
+    Returns: theme directory path or empty string on failure
+    '''
+    started = time.perf_counter()
+    folder = os.path.abspath(folder)
+    title = title or os.path.basename(folder)
+    name = re.sub(r'[^A-Za-z0-9_-]+', '_', name or title).strip('_')
+
+    theme_dirpath = os.path.join(THEMES_DIR, name)
+    if not name or os.path.exists(theme_dirpath):
+        print(f'Theme already exists or invalid theme name: {theme_dirpath}')
+        return ''
+
+    try:
+        sources = list_images(folder)
+    except OSError as e:
+        print(f'Cannot read folder {folder}, {e.strerror}')
+        return ''
+
+    # checked before images are analyzed (eg. system-wide install in /opt)
+    if not os.access(THEMES_DIR, os.W_OK | os.X_OK):
+        print(f'Cannot write into themes directory: {THEMES_DIR}')
+        return ''
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(sources) // (4 * workers))
+    tmp_dirpath = os.path.join(THEMES_DIR, f'.{name}.import-tmp')
+    with Pool(workers) as pool:
+        images = [i for i in pool.map(__analyze, sources, chunksize) if i is not None]
+        if len(images) < 2:
+            print(f'At least 2 images are required, found {len(images)} in {folder}')
+            return ''
+
+        images = order_images(images, order)
+        daytimes = assign_daytimes([i[KEY_LUMINANCE] for i in images])
+
+        # files are numbered in playback order
+        numbers = dict((idx, n + 1) for n, idx in enumerate(
+            idx for daytime in themedef.DAYTIMES for idx in daytimes[daytime]))
+
+        shutil.rmtree(tmp_dirpath, ignore_errors=True)
+        try:
+            os.makedirs(tmp_dirpath)
+        except OSError as e:
+            print(f'Cannot create directory: {tmp_dirpath}, {e.strerror}')
+            return ''
+        jobs = [(images[idx][KEY_PATH], os.path.join(tmp_dirpath, f'{name}_{n}.jpg'), tuple(size), quality)
+                for idx, n in numbers.items()]
+        converted = pool.map(__normalise, jobs, chunksize)
+
+    theme = {themedef.TITLE: title, themedef.DESCRIPTION: f'Imported from {folder}', themedef.CREDITS: '',
+             themedef.FILENAME: f'{name}_*.jpg',
+             themedef.FILE_LIST: dict((d, [numbers[idx] for idx in daytimes[d]]) for d in themedef.DAYTIMES),
+             themedef.OPTIONAL_SETTINGS: {}}
+
+    # dense timelapses: transition takes half of average frame time instead of default
+    if len(images) * DEFAULT_TRANSITION_TIME * 2 > DAY_LENGTH:
+        theme[themedef.OPTIONAL_SETTINGS][themedef.OPT_PREF_TRANSITION_DURATION] = DAY_LENGTH // (2 * len(images))
+
+    try:
+        with open(os.path.join(tmp_dirpath, THEME_FILE), 'w') as f:
+            json.dump(theme, f, indent=4)
+        imported = all(converted) and validate_theme(tmp_dirpath)
+        if imported:
+            os.rename(tmp_dirpath, theme_dirpath)
+    except OSError as e:
+        print(f'Cannot write theme {theme_dirpath}, {e.strerror}')
+        imported = False
+
+    if not imported:
+        shutil.rmtree(tmp_dirpath, ignore_errors=True)
+        return ''
+
+    summary = ', '.join(f'{d}: {len(daytimes[d])}' for d in themedef.DAYTIMES)
+    print(f'Imported {len(images)} images into {theme_dirpath} in {time.perf_counter() - started:.1f} s '
+          f'using {workers} processes ({summary})')
+    return theme_dirpath
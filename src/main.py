@@ -1,51 +1,245 @@
 #!/bin/python3
 
 import os
+import sys
 import json
+import argparse
 import subprocess
 import threading
+from datetime import datetime
 
 import daemon
+import renderer
+import importer
+import sweep
+import utils.profiling as profiling
+import utils.blobstore as blobstore
+import utils.schedule_service as schedule_service
 import gui.appindicator as appindicator
+from gui.thumbnails import generate_thumbnail_atlas
 from utils.theme import select_theme
-from dynwallpaper import DynWallpaper
-from utils.gnome_theming import change_wallpaper
+from dynwallpaper import DynWallpaper, clear_wallpaper_xml_dir
+from playlist import Playlist, ThemeRotation
+from utils.luminance import LuminanceIndex
+from utils.power import on_battery
+from utils.misc import format_size
+from utils.monitors import load_layout
+from utils.gnome_theming import change_wallpaper, change_picture_options, PICTURE_SPANNED
 from definitions.version import VERSION, NAME, AUTHOR
 
 
-def dynwallpaper_set_theme():
+def parse_size(value: str) -> tuple:
+    try:
+        size = tuple(int(x) for x in value.lower().split('x'))
+        if len(size) != 2 or min(size) < 1:
+            raise ValueError
+        return size
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid size: {value}')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=NAME.lower())
+    parser.add_argument(profiling.FLAG_PROFILE, action='store_true',
+                        help=f'enable profiling mode (same as {profiling.ENV_PROFILE}=1), SIGUSR1 dumps profiling data')
+    parser.add_argument('--render', action='store_true',
+                        help='render current wallpaper frame into image file instead of GNOME slideshow XML')
+    parser.add_argument('--render-interval', type=float, default=renderer.RENDER_INTERVAL_MIN, metavar='MINUTES',
+                        help=f'minutes between rendered frames (default: {renderer.RENDER_INTERVAL_MIN})')
+    parser.add_argument('--render-size', type=parse_size, default=renderer.RENDER_SIZE, metavar='WIDTHxHEIGHT',
+                        help=f"size of rendered frames (default: {'x'.join(map(str, renderer.RENDER_SIZE))})")
+    parser.add_argument('--render-output', default=renderer.RENDER_OUTPUT_FILE, metavar='PATH',
+                        help='rendered frame file, atomically replaced (default: %(default)s)')
+    parser.add_argument('--render-command', default='', metavar='COMMAND',
+                        help='shell command run after every rendered frame, {} is replaced with frame path')
+    parser.add_argument('--no-service', action='store_true',
+                        help='do not use shared schedule service even if it is running')
+    parser.add_argument('--benchmark-render', action='store_true',
+                        help='measure frame decode and blend time of selected theme and exit')
+
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.add_parser('dedupe', help='store theme images in content-addressed blob store and link duplicates')
+    commands.add_parser('gc', help='remove blobs no longer used by any theme')
+
+    import_parser = commands.add_parser('import', help='create theme from folder of images (eg. day timelapse)')
+    import_parser.add_argument('folder', help='folder with images')
+    import_parser.add_argument('--name', default='', help='theme directory name (default: folder name)')
+    import_parser.add_argument('--title', default='', help='theme title (default: folder name)')
+    import_parser.add_argument('--order', choices=importer.ORDERS, default=importer.ORDER_AUTO,
+                               help='image order: EXIF capture time, brightness or filename '
+                               '(default: %(default)s, EXIF when available)')
+    import_parser.add_argument('--size', type=parse_size, default=importer.IMPORT_SIZE, metavar='WIDTHxHEIGHT',
+                               help=f"size of theme images (default: {'x'.join(map(str, importer.IMPORT_SIZE))})")
+    import_parser.add_argument('--quality', type=int, default=importer.IMPORT_QUALITY,
+                               help='JPEG quality of theme images (default: %(default)s)')
+    import_parser.add_argument('--workers', type=int, default=None,
+                               help='number of worker processes (default: all cores)')
+
+    sweep.add_arguments(commands.add_parser('sweep', help=sweep.DESCRIPTION))
+
+    return parser.parse_args()
+
+
+@profiling.profiled()
+def dynwallpaper_set_theme(apply_wallpaper=True, theme_dirpath='') -> DynWallpaper:
     print(f"{NAME} by {AUTHOR} (version: {VERSION})\n")
 
     Dynwall = DynWallpaper()
 
     print('Finding your current location...\n')
-    Dynwall.set_geolocation_online()
+    location = schedule_service.fetch_location() if schedule_service.enabled() else None
+    if location is None:
+        Dynwall.set_geolocation_online()
+    else:
+        Dynwall.set_geolocation_manually(*location)
 
     Dynwall.update_soltime()
 
     print("\n")
-    Dynwall.set_theme(select_theme())
+    Dynwall.set_theme(theme_dirpath or select_theme())
 
     # debug info
     print('\n DEBUG INFO\n')
     print(json.dumps(Dynwall.get_data_summary(), indent=4))
 
-    xmlpath, _ = Dynwall.create_wallpaper_xml_files()
-    xmlpath = os.path.abspath(xmlpath)
-
-    # set newly generated wallpaper
-    change_wallpaper(xmlpath)
+    if apply_wallpaper:
+        Dynwall.set_layout(load_layout())
+        clear_wallpaper_xml_dir()
+        Dynwall.create_wallpaper_xml_files()
+        xmlpath = Dynwall.wallpaper_xml_path(low_power=on_battery())
+
+        # set newly generated wallpaper
+        if xmlpath:
+            change_wallpaper(os.path.abspath(xmlpath))
+            if Dynwall.layout() is not None:
+                change_picture_options(PICTURE_SPANNED)
+
+    return Dynwall
+
+
+def prepare_theme(Dynwall: DynWallpaper, theme_dirpath: str):
+    # theme is opened into fresh instance, shared one is switched only when it is valid
+    summary = Dynwall.get_data_summary()
+    prepared = DynWallpaper()
+    prepared.set_geolocation_manually(summary['lat'], summary['lon'])
+    prepared.set_timezone(summary['timezone'])
+    prepared.set_layout(Dynwall.layout())
+    prepared.update_soltime()
+
+    if not prepared.set_theme(theme_dirpath):
+        print(f'Cannot switch to theme: {theme_dirpath}')
+        return None
+    return prepared
+
+
+@profiling.profiled()
+def dynwallpaper_switch_theme(Dynwall: DynWallpaper, theme_dirpath: str) -> bool:
+    prepared = prepare_theme(Dynwall, theme_dirpath)
+    if prepared is None:
+        return False
+
+    # canvases are composited before shared instance is locked, lock is held only for the swap
+    prepared.create_wallpaper_xml_files()
+    xmlpath = prepared.wallpaper_xml_path(low_power=on_battery())
+    if not xmlpath:
+        prepared.remove_xml_files()
+        return False
+
+    with Dynwall.lock():
+        Dynwall.adopt(prepared)
+        change_wallpaper(os.path.abspath(xmlpath))
+        Dynwall.remove_stale_xml_files()
+    return True
+
+
+@profiling.profiled()
+def renderer_switch_theme(Dynwall: DynWallpaper, theme_dirpath: str, args: argparse.Namespace) -> bool:
+    prepared = prepare_theme(Dynwall, theme_dirpath)
+    if prepared is None:
+        return False
+
+    Dynwall.adopt(prepared)
+    return renderer.render_frame(Dynwall, datetime.now(), args.render_size, args.render_output)
+
+
+def run_command(args: argparse.Namespace) -> int:
+    if args.command == 'dedupe':
+        report = blobstore.dedupe()
+        print(f"{report['files']} files, {report['blobs']} new blobs, {report['linked']} duplicates linked, "
+              f"{format_size(report['saved_bytes'])} saved")
+        if report['read_only']:
+            print(f"{report['read_only']} files are hardlinks (filesystem without reflinks), they were made "
+                  "read-only as editing one would change every theme sharing it")
+    elif args.command == 'gc':
+        report = blobstore.gc()
+        print(
+            f"{report['removed']} unused blobs removed, {format_size(report['freed_bytes'])} freed")
+    elif args.command == 'import':
+        if not importer.import_theme(args.folder, args.name, args.title, args.order, args.size,
+                                     args.quality, args.workers):
+            return 1
+    elif args.command == 'sweep':
+        return sweep.run(args)
+    return 0
+
+
+def build_luminance_index() -> LuminanceIndex:
+    lum_index = LuminanceIndex()
+    lum_index.load()
+    if lum_index.update():
+        print('Luminance index updated')
+    return lum_index
 
 
 if __name__ == "__main__":
-    theme_daemon = threading.Thread(target=daemon.loop, daemon=True)
+    args = parse_args()
+    profiling.install()
+
+    if args.command is not None:
+        sys.exit(run_command(args))
+
+    if not args.no_service and schedule_service.enable():
+        print(f'Using shared schedule service: {schedule_service.SOCKET_PATH}')
+
+    playlist = Playlist()
+    playlist.open()
+
+    Dynwall = dynwallpaper_set_theme(
+        apply_wallpaper=not (args.render or args.benchmark_render),
+        theme_dirpath=playlist.theme_on(datetime.now()) if playlist.ready() else '')
 
-    dynwallpaper_set_theme()
+    if args.benchmark_render:
+        print(json.dumps(renderer.benchmark(
+            Dynwall, args.render_size), indent=4))
+        sys.exit(0)
+
+    lum_index = build_luminance_index()
+    generate_thumbnail_atlas()
+
+    rotation = None
+    if playlist.ready():
+        rotation = ThemeRotation(
+            playlist, render_size=args.render_size if args.render else None)
+
+    theme_daemon = threading.Thread(
+        target=daemon.loop, args=(Dynwall, lum_index, not args.render, rotation), daemon=True)
 
     print('\nstarting wallmatic daemon...')
 
     theme_daemon.start()
 
+    if args.render:
+        render_daemon = threading.Thread(target=renderer.render_loop, args=(
+            Dynwall, args.render_interval, args.render_size, args.render_output, args.render_command), daemon=True)
+        render_daemon.start()
+        print(f'\nrendering wallpaper frames into: {args.render_output}')
+
     print('\nApp is now running in background...\n')
 
+    if args.render:
+        appindicator.set_theme_selected_callback(
+            lambda theme_dirpath: renderer_switch_theme(Dynwall, theme_dirpath, args))
+    else:
+        appindicator.set_theme_selected_callback(
+            lambda theme_dirpath: dynwallpaper_switch_theme(Dynwall, theme_dirpath))
     appindicator.main()
@@ -0,0 +1,162 @@
+#!/bin/python3
+
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+
+import renderer
+import definitions.playlist as playlistdef
+from dynwallpaper import DynWallpaper
+from utils.theme import validate_theme_dir
+from definitions.dirs import PLAYLIST_FILE, THEMES_DIR
+
+# upcoming theme is prepared in background this long before rotation
+PREPARE_AHEAD = timedelta(hours=12)
+NICENESS = 19
+
+
+class Playlist:
+    def __init__(self):
+        self.__themes = []
+        self.__period_days = 1
+        self.__prescale_images = False
+        self.__opened = False
+
+    def open(self, playlist_path=PLAYLIST_FILE) -> bool:
+        try:
+            with open(playlist_path, 'r') as f:
+                playlist = json.load(f)
+
+            rotation = playlist.get(playlistdef.ROTATION, playlistdef.ROTATION_DAILY)
+            period_days = playlistdef.ROTATION_DAYS.get(rotation, rotation)
+            if not isinstance(period_days, int) or period_days < 1:
+                print(f'Invalid playlist rotation: {rotation}')
+                return False
+
+            themes = [os.path.join(THEMES_DIR, t)
+                      for t in playlist.get(playlistdef.THEMES, [])]
+            invalid = [t for t in themes if not validate_theme_dir(t)]
+            if invalid or not themes:
+                print(f'Invalid or missing playlist themes: {invalid}')
+                return False
+
+            self.__themes = themes
+            self.__period_days = period_days
+            self.__prescale_images = playlist.get(playlistdef.OPTIONAL_SETTINGS, {}).get(
+                playlistdef.OPT_PRESCALE_IMAGES, False)
+            self.__opened = True
+            return True
+        except IOError:
+            pass
+        except json.JSONDecodeError:
+            print("Error occurred while trying to parse JSON file: ", playlist_path)
+
+        self.__opened = False
+        return False
+
+    def ready(self) -> bool:
+        return self.__opened
+
+    def prescale_images(self) -> bool:
+        return self.__prescale_images
+
+    def __period_index(self, date: datetime) -> int:
+        # ordinal 1 is monday, so weekly rotation happens on mondays
+        return (date.toordinal() - 1) // self.__period_days
+
+    def theme_on(self, date: datetime) -> str:
+        return self.__themes[self.__period_index(date) % len(self.__themes)]
+
+    def next_rotation(self, date: datetime) -> datetime:
+        return datetime.fromordinal((self.__period_index(date) + 1) * self.__period_days + 1)
+
+
+def lower_thread_priority():
+    # on linux niceness is per thread
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICENESS)
+    except (AttributeError, OSError):
+        pass
+
+
+class ThemeRotation:
+    '''
+    \nRotates playlist themes. Catalog data and schedule XML (or pre-scaled frames
+    in renderer mode) of upcoming theme are prepared by low priority background
+    worker, so rotation itself is only a switch to already generated files
+    '''
+
+    def __init__(self, playlist: Playlist, render_size=None):
+        self.__playlist = playlist
+        self.__render_size = render_size
+        self.__lock = threading.Lock()
+        self.__worker = None
+        self.__prepared = None  # tuple( rotation: datetime, DynWallpaper )
+        self.__next_rotation = playlist.next_rotation(datetime.now())
+
+    def __prepare(self, dynwall: DynWallpaper, rotation: datetime):
+        summary = dynwall.get_data_summary()
+        prepared = DynWallpaper()
+        prepared.set_geolocation_manually(summary['lat'], summary['lon'])
+        prepared.set_timezone(summary['timezone'])
+        prepared.set_layout(dynwall.layout())
+        prepared.update_soltime()
+
+        if not prepared.set_theme(self.__playlist.theme_on(rotation)):
+            print(f'Cannot prepare playlist theme: {self.__playlist.theme_on(rotation)}')
+            return
+
+        if self.__render_size is None:
+            prepared.create_wallpaper_xml_files()
+        elif self.__playlist.prescale_images():
+            wallpaper_from, wallpaper_to, _ = prepared.theme_frame_ontime(rotation)
+            renderer.load_frame(wallpaper_from, self.__render_size)
+            renderer.load_frame(wallpaper_to, self.__render_size)
+
+        with self.__lock:
+            self.__prepared = rotation, prepared
+
+    def __prepare_in_background(self, dynwall: DynWallpaper, rotation: datetime):
+        lower_thread_priority()
+        self.__prepare(dynwall, rotation)
+
+    def update(self, dynwall: DynWallpaper) -> bool:
+        '''
+        \nStart preparing upcoming theme when rotation is near, rotate when it is due\n
+        Returns: True if dynwall was switched to next theme
+        '''
+        now = datetime.now()
+        rotation = self.__next_rotation
+
+        if now < rotation:
+            with self.__lock:
+                prepared = self.__prepared
+            worker_busy = self.__worker is not None and self.__worker.is_alive()
+            if rotation - now <= PREPARE_AHEAD and prepared is None and not worker_busy:
+                self.__worker = threading.Thread(target=self.__prepare_in_background, args=(
+                    dynwall, rotation), name='playlist-prepare', daemon=True)
+                self.__worker.start()
+            return False
+
+        if self.__worker is not None:
+            self.__worker.join()
+
+        with self.__lock:
+            prepared, self.__prepared = self.__prepared, None
+
+        if prepared is None or self.__playlist.theme_on(prepared[0]) != self.__playlist.theme_on(now):
+            # not prepared in time or rotation was missed (eg. system was suspended)
+            if prepared is not None:
+                prepared[1].remove_xml_files()
+            self.__prepare(dynwall, now)
+            with self.__lock:
+                prepared, self.__prepared = self.__prepared, None
+
+        self.__next_rotation = self.__playlist.next_rotation(now)
+
+        if prepared is None:
+            return False
+
+        dynwall.adopt(prepared[1])
+        return True
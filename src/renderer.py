@@ -0,0 +1,137 @@
+#!/bin/python3
+
+import os
+import time
+import tempfile
+import subprocess
+import numpy as np
+from PIL import Image, ImageOps
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from dynwallpaper import DynWallpaper
+from utils.profiling import profiled
+from definitions.dirs import RENDER_OUTPUT_FILE
+
+"""
+Renderer mode for desktops without GNOME slideshow XML support\n
+Current frame of the day schedule (including crossfade between wallpapers)
+is rendered into single image file which is atomically replaced every few minutes
+"""
+
+RENDER_SIZE = (1920, 1080)
+RENDER_INTERVAL_MIN = 5
+RENDER_QUALITY = 92
+
+# decoded display-sized frames kept in memory (each 1920x1080 frame takes ~6 MB)
+FRAME_CACHE_SIZE = 6
+
+
+@lru_cache(maxsize=FRAME_CACHE_SIZE)
+def __decode_frame(img_path: str, mtime: float, size: tuple) -> np.ndarray:
+    with Image.open(img_path) as img:
+        img.draft('RGB', size)
+        img = ImageOps.fit(img.convert('RGB'), size, Image.LANCZOS)
+    frame = np.asarray(img, dtype=np.uint8)
+    frame.setflags(write=False)
+    return frame
+
+
+def load_frame(img_path: str, size=RENDER_SIZE) -> np.ndarray:
+    '''
+    \nDecode image scaled and cropped to display size (cached, keyed by modification time)\n
+    Returns: read-only uint8 array of shape (height, width, 3)
+    '''
+    return __decode_frame(img_path, os.stat(img_path).st_mtime, tuple(size))
+
+
+def blend_frames(frame_from: np.ndarray, frame_to: np.ndarray, progress: float) -> np.ndarray:
+    '''
+    \nCrossfade two frames in 8-bit fixed point: from * (256 - w) + to * w\n
+    progress: 0.0 (only frame_from) - 1.0 (only frame_to)
+    '''
+    weight = int(round(min(max(progress, 0.0), 1.0) * 256))
+    if weight == 0:
+        return frame_from
+    if weight == 256:
+        return frame_to
+
+    blended = np.multiply(frame_from, 256 - weight, dtype=np.uint16)
+    blended += np.multiply(frame_to, weight, dtype=np.uint16)
+    blended >>= 8
+    return blended.astype(np.uint8)
+
+
+def save_frame(frame: np.ndarray, output_path: str) -> bool:
+    # write next to output file and rename, wallpaper setters never see partial image,
+    # unique temporary file as render loop and tray theme switch may render at once
+    output_dirpath = os.path.dirname(os.path.abspath(output_path))
+    tmp_path = ''
+    try:
+        os.makedirs(output_dirpath, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=output_dirpath)
+        with os.fdopen(fd, 'wb') as f:
+            Image.fromarray(frame).save(f, "JPEG", quality=RENDER_QUALITY)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, output_path)
+        return True
+    except IOError:
+        print(f"Failed to create file: {output_path}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return False
+
+
+@profiled()
+def render_frame(dynwall: DynWallpaper, date: datetime, size=RENDER_SIZE, output_path=RENDER_OUTPUT_FILE) -> bool:
+    with dynwall.lock():
+        wallpaper_from, wallpaper_to, progress = dynwall.theme_frame_ontime(date)
+    frame = blend_frames(load_frame(wallpaper_from, size),
+                         load_frame(wallpaper_to, size), progress)
+    return save_frame(frame, output_path)
+
+
+@profiled()
+def render_loop(dynwall: DynWallpaper, interval_min=RENDER_INTERVAL_MIN, size=RENDER_SIZE,
+                output_path=RENDER_OUTPUT_FILE, command=''):
+    '''
+    \nRender current frame every interval_min minutes\n
+    command: optional shell command run after every render, "{}" is replaced with output path
+    '''
+    while True:
+        if render_frame(dynwall, datetime.now(), size, output_path) and command:
+            subprocess.call(command.replace('{}', f'"{output_path}"'), shell=True)
+        time.sleep(interval_min * 60)
+
+
+def benchmark(dynwall: DynWallpaper, size=RENDER_SIZE, repeats=20) -> dict:
+    '''
+    \nMeasure average decode (cold and cached) and blend time per frame in milliseconds\n
+    '''
+    now = datetime.now()
+    wallpaper_from = dynwall.theme_frame_ontime(now)[0]
+    wallpaper_to = dynwall.theme_frame_ontime(now + timedelta(hours=12))[0]
+
+    results = {}
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        __decode_frame.cache_clear()
+        load_frame(wallpaper_from, size)
+    results['decode_ms'] = (time.perf_counter() - started) * 1000 / repeats
+
+    frame_from, frame_to = load_frame(
+        wallpaper_from, size), load_frame(wallpaper_to, size)
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        load_frame(wallpaper_from, size)
+    results['decode_cached_ms'] = (
+        time.perf_counter() - started) * 1000 / repeats
+
+    started = time.perf_counter()
+    for i in range(repeats):
+        blend_frames(frame_from, frame_to, (i + 1) / (repeats + 1))
+    results['blend_ms'] = (time.perf_counter() - started) * 1000 / repeats
+
+    return results
@@ -0,0 +1,189 @@
+#!/bin/python3
+
+import os
+import sys
+import json
+import socket
+import signal
+import argparse
+import threading
+import socketserver
+from datetime import datetime, timedelta
+
+import definitions.service as servicedef
+import utils.profiling as profiling
+from dynwallpaper import DynWallpaper, SCHEDULE_DAYS
+from utils.theme import THEME_FILE
+from utils.schedule_service import SOCKET_PATH
+from definitions.dirs import THEMES_DIR
+from definitions.version import NAME
+
+"""
+System-wide schedule service for multi-user hosts\n
+Geolocation is requested once per host and schedule XML of every theme is generated
+once per timezone and day, then served to all user sessions over Unix socket
+(one JSON request line and one JSON reply line per connection), see utils/schedule_service.py
+"""
+
+SOCKET_MODE = 0o666  # every local user may connect
+MAX_REQUEST_SIZE = 1 << 16
+MAX_CACHED_SCHEDULES = 64
+MAX_SCHEDULE_DAYS = 4 * SCHEDULE_DAYS
+
+
+class ScheduleService:
+    def __init__(self, latitude: float, longitude: float):
+        self.__latitude, self.__longitude = latitude, longitude
+        self.__lock = threading.Lock()
+        self.__schedules = {}  # (theme, theme mtime, timezone, transition time, days) -> schedule dict
+
+    def handle(self, message: dict) -> dict:
+        request = message[servicedef.REQUEST]
+        if request == servicedef.REQ_LOCATION:
+            return {servicedef.LAT: self.__latitude, servicedef.LON: self.__longitude}
+        if request == servicedef.REQ_SCHEDULE:
+            return self.schedule(str(message[servicedef.THEME]), float(message[servicedef.TIMEZONE]),
+                                 int(message[servicedef.TRANSITION_TIME]), int(message[servicedef.DAYS]))
+        return {servicedef.ERROR: f'unknown request: {request}'}
+
+    @profiling.profiled()
+    def schedule(self, theme_dirpath: str, timezone: float, transition_time: int, days: int) -> dict:
+        '''
+        \nSchedule XML of installed theme, generated on first request and cached
+        until its first day is over (next sunrise) or theme is modified\n
+        '''
+        # only shared themes are served, private themes of users are generated in their sessions
+        theme_dirpath = os.path.abspath(theme_dirpath)
+        if os.path.commonpath([theme_dirpath, THEMES_DIR]) != THEMES_DIR:
+            return {servicedef.ERROR: f'theme is not installed in {THEMES_DIR}'}
+        if not 0 < days <= MAX_SCHEDULE_DAYS:
+            return {servicedef.ERROR: f'invalid schedule length: {days} days'}
+        try:
+            mtime = os.stat(os.path.join(theme_dirpath, THEME_FILE)).st_mtime
+        except OSError:
+            return {servicedef.ERROR: f'invalid theme: {theme_dirpath}'}
+
+        key = theme_dirpath, mtime, timezone, transition_time, days
+        now = datetime.utcnow() + timedelta(hours=timezone)
+
+        # generation is serialized, sessions starting at once wait for single generation
+        with self.__lock:
+            cached = self.__schedules.get(key)
+            if cached is not None and now < datetime.fromisoformat(cached[servicedef.SCHEDULE_START]) + timedelta(days=1):
+                return cached
+
+            dynwall = DynWallpaper()
+            dynwall.set_geolocation_manually(self.__latitude, self.__longitude)
+            dynwall.set_timezone(timezone)
+            dynwall.update_soltime()
+            if not dynwall.set_theme(theme_dirpath):
+                return {servicedef.ERROR: f'invalid theme: {theme_dirpath}'}
+
+            schedule = dynwall.generate_wallpaper_xml(
+                transition_time, days, now=now)
+
+            self.__schedules.pop(key, None)
+            while len(self.__schedules) >= MAX_CACHED_SCHEDULES:
+                # oldest entry first (dicts keep insertion order)
+                self.__schedules.pop(next(iter(self.__schedules)))
+            self.__schedules[key] = schedule
+
+        return schedule
+
+
+class ScheduleRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline(MAX_REQUEST_SIZE)
+        if not line:
+            # connection check only
+            return
+        try:
+            reply = self.server.service.handle(json.loads(line))
+        except (ValueError, KeyError, TypeError) as e:
+            reply = {servicedef.ERROR: f'invalid request: {e}'}
+        try:
+            self.wfile.write(json.dumps(reply).encode() + b'\n')
+        except BrokenPipeError:
+            pass
+
+
+def __service_running(socket_path: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def serve(socket_path=SOCKET_PATH, location=None) -> int:
+    '''
+    \nRun schedule service until interrupted\n
+    location: tuple( latitude, longitude ), default: Geoclue location of host\n
+    Returns: exit code
+    '''
+    if __service_running(socket_path):
+        print(f'Schedule service is already running: {socket_path}')
+        return 1
+
+    dynwall = DynWallpaper()
+    if location is None:
+        print('Finding host location...\n')
+        if not dynwall.set_geolocation_online():
+            # fallback location would be served to (and used for schedules of) every session
+            print('Cannot find host location, set it with --location LAT,LON')
+            return 1
+    else:
+        dynwall.set_geolocation_manually(*location)
+    summary = dynwall.get_data_summary()
+
+    try:
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        if os.path.exists(socket_path):
+            # left by previous run
+            os.remove(socket_path)
+        server = socketserver.ThreadingUnixStreamServer(
+            socket_path, ScheduleRequestHandler)
+        os.chmod(socket_path, SOCKET_MODE)
+    except OSError as e:
+        print(f'Cannot listen on {socket_path}, {e.strerror}')
+        return 1
+
+    server.daemon_threads = True
+    server.service = ScheduleService(summary['lat'], summary['lon'])
+    print(f"Schedule service for location ({summary['lat']}, {summary['lon']}) listening on {socket_path}")
+
+    # stopping service (SIGTERM) removes socket as well
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog=f'{NAME.lower()}-service',
+                                     description='share geolocation and wallpaper schedules between user sessions')
+    parser.add_argument(profiling.FLAG_PROFILE, action='store_true',
+                        help=f'enable profiling mode (same as {profiling.ENV_PROFILE}=1), SIGUSR1 dumps profiling data')
+    parser.add_argument('--socket', default=SOCKET_PATH, metavar='PATH',
+                        help='Unix socket to listen on (default: %(default)s)')
+    parser.add_argument('--location', metavar='LAT,LON',
+                        help='host location, skips Geoclue request (eg. when service user has no location access)')
+    args = parser.parse_args()
+    profiling.install()
+
+    location = None
+    if args.location:
+        try:
+            location = tuple(float(x) for x in args.location.split(','))
+            if len(location) != 2:
+                raise ValueError
+        except ValueError:
+            parser.error(f'invalid location: {args.location}')
+
+    sys.exit(serve(args.socket, location))
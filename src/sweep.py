@@ -0,0 +1,238 @@
+#!/bin/python3
+
+import io
+import os
+import sys
+import math
+import time
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import utils.solartime as soltime
+import definitions.theme as themedef
+from dynwallpaper import calculate_timings, low_power_filelist, DAY_LENGTH, NIGHTMODE, LOW_POWER
+from utils.theme import list_valid_themes, WallpaperTheme
+from utils.misc import flatten
+from definitions.dirs import THEMES_DIR
+from definitions.version import NAME
+
+"""
+Sweep validator of timing engine\n
+Runs solar time calculation and day timings of every theme variant (standard, low power
+and night mode) over a grid of latitudes, longitudes, timezones and every day of the year,
+and reports every invariant violation. One latitude is one batch of the process pool\n
+Timings depend only on differences between solar times and on day length (longitude and
+timezone shift all of them), so every distinct combination is evaluated only once per batch\n
+Runs without desktop stack (eg. release gate in headless CI): python3 src/sweep.py
+"""
+
+LAT_STEP = 1.0
+LON_STEP = 15.0
+# offsets from nominal timezone of longitude (round(lon / 15))
+TZ_OFFSETS = (-1.0, -0.5, 0.0, 0.5, 1.0)
+
+# default transition duration of generated schedules
+TRANSITION_TIME = 600
+
+STANDARD = "Standard"
+
+V_SOLAR_NAN = 'solar time is NaN (math domain error)'
+V_ENGINE_ERROR = 'timing engine error'
+V_NEGATIVE = 'negative duration'
+V_SUM = 'durations do not sum up to day length'
+V_EMPTY_PHASE = 'phase has wallpapers but no timings'
+
+MAX_EXAMPLES = 3
+
+DESCRIPTION = 'validate timing engine over grid of locations, timezones and days of year, ' \
+              'exit code is 1 on any invariant violation'
+
+
+def theme_variants(theme_dirpaths: list) -> list:
+    '''
+    \nReturns: list of tuple( theme name, variant, transition time, daytime files amounts, nightmode )
+    for every schedule generated from given themes
+    '''
+    variants = []
+    for theme_dirpath in theme_dirpaths:
+        theme = WallpaperTheme()
+        if not theme.open(theme_dirpath):
+            print(f'Invalid theme: {theme_dirpath}')
+            continue
+
+        name = os.path.basename(theme.dirpath())
+        transition_time = theme.optional_settings().get(
+            themedef.OPT_PREF_TRANSITION_DURATION, TRANSITION_TIME)
+        amounts = dict((d, len(f)) for d, f in theme.filelist_all().items())
+        low_power = dict((d, len(f)) for d, f in low_power_filelist(
+            theme.filelist_all()).items())
+        night = dict((d, 0) for d in themedef.DAYTIMES)
+        night[themedef.FL_DAY] = len(theme.filelist_night())
+
+        variants.append((name, STANDARD, transition_time, amounts, False))
+        variants.append((name, LOW_POWER, 0, low_power, False))
+        variants.append((name, NIGHTMODE, 0 if night[themedef.FL_DAY] == 1 else transition_time, night, True))
+    return variants
+
+
+def timing_violations(timings: dict, daytime_files_amounts: dict, day_length: int) -> list:
+    violations = []
+    entries = flatten(timings.values())
+    if any(static < 0 or transition < 0 for static, transition in entries):
+        violations.append(V_NEGATIVE)
+    if sum(flatten(entries)) != day_length:
+        violations.append(V_SUM)
+    if any(daytime_files_amounts[d] and not timings[d] for d in themedef.DAYTIMES):
+        violations.append(V_EMPTY_PHASE)
+    return violations
+
+
+def __evaluate(variant: tuple, soltimes: tuple, day_length: int) -> list:
+    _, _, transition_time, amounts, nightmode = variant
+    if nightmode:
+        day_length = DAY_LENGTH
+    try:
+        timings = calculate_timings(
+            transition_time, soltimes, day_length, amounts, nightmode)
+    except Exception as e:
+        return [f'{V_ENGINE_ERROR} ({type(e).__name__}: {e})']
+    return timing_violations(timings, amounts, day_length)
+
+
+def __solar_day(latitude: float, date: datetime):
+    # same composition as soltime.timetuple, but hour angles are computed once per latitude and date
+    fy = soltime.fractional_year(date)
+    eqt = soltime.eq_time(fy)
+    dec = soltime.sol_declination(fy)
+    try:
+        ha = soltime.hour_angle_sunrise_sunset(latitude, dec)
+        ha_twilight = soltime.hour_angle_civil_twilight(latitude, dec)
+    except (ValueError, ZeroDivisionError):
+        return None
+    if math.isnan(ha) or math.isnan(ha_twilight):
+        return None
+    return eqt, ha, ha_twilight
+
+
+def __sweep_latitude(task: tuple) -> dict:
+    # worker: all longitudes, timezones and days of one latitude
+    latitude, longitudes, tz_offsets, dates, variants = task
+    report = {}  # ( theme, variant, violation ) -> [ count, examples ]
+    evaluated = {}  # ( variant index, solar time differences, day length ) -> violations
+
+    def add(key, count, example):
+        entry = report.setdefault(key, [0, []])
+        entry[0] += count
+        if len(entry[1]) < MAX_EXAMPLES:
+            entry[1].append(example)
+
+    solar_days = [__solar_day(latitude, date) for date in dates]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for longitude in longitudes:
+            for timezone in (round(longitude / 15) + o for o in tz_offsets):
+                soltimes = []
+                for solar_day in solar_days:
+                    if solar_day is None:
+                        soltimes.append(None)
+                        continue
+                    eqt, ha, ha_twilight = solar_day
+                    soltimes.append((soltime.sunrise(longitude, latitude, timezone, ha, eqt),
+                                     soltime.sol_noon(longitude, timezone, eqt),
+                                     soltime.sunset(longitude, latitude, timezone, ha, eqt),
+                                     soltime.civil_twilight(longitude, latitude, timezone, ha_twilight, eqt)))
+
+                for i, date in enumerate(dates[:-1]):
+                    example = latitude, longitude, timezone, date.strftime('%m-%d')
+                    if soltimes[i] is None or soltimes[i + 1] is None:
+                        add(('*', '*', V_SOLAR_NAN), 1, example)
+                        continue
+
+                    sunrise, snoon, sunset, twilight = soltimes[i]
+                    day_length = DAY_LENGTH + soltimes[i + 1][0] - sunrise
+                    differences = snoon - sunrise, sunset - snoon, twilight - sunset, day_length
+                    for v, variant in enumerate(variants):
+                        key = v, differences
+                        if key not in evaluated:
+                            evaluated[key] = __evaluate(
+                                variant, soltimes[i], day_length)
+                        for violation in evaluated[key]:
+                            add((variant[0], variant[1], violation), 1, example)
+
+    return report
+
+
+def sweep(theme_dirpaths=None, lat_step=LAT_STEP, lon_step=LON_STEP, tz_offsets=TZ_OFFSETS,
+          year=None, workers=None) -> dict:
+    '''
+    \nValidate timing engine for every combination of grid location, timezone and day of year\n
+    Returns: report dict( tuple( theme, variant, violation ) -> tuple( count, examples ) ),
+    empty when no invariant is violated
+    '''
+    if theme_dirpaths is None:
+        theme_dirpaths = [os.path.join(THEMES_DIR, t)
+                          for t in sorted(list_valid_themes())]
+    variants = theme_variants(theme_dirpaths)
+    year = year or datetime.now().year
+
+    latitudes = [round(-90 + i * lat_step, 6) for i in range(int(180 / lat_step) + 1)]
+    longitudes = [round(-180 + i * lon_step, 6) for i in range(int(360 / lon_step))]
+    first_day = datetime(year, 1, 1)
+    # last date is only used for day length of the last day of year
+    dates = [first_day + timedelta(days=d)
+             for d in range((datetime(year + 1, 1, 1) - first_day).days + 1)]
+
+    combinations = len(latitudes) * len(longitudes) * len(tz_offsets) * (len(dates) - 1)
+    print(f'Sweeping {combinations} combinations (location x timezone x day) '
+          f'of {len(variants)} schedules from {len(theme_dirpaths)} themes...')
+
+    started = time.perf_counter()
+    report = {}
+    tasks = [(lat, longitudes, tz_offsets, dates, variants) for lat in latitudes]
+    with Pool(workers) as pool:
+        for batch in pool.imap_unordered(__sweep_latitude, tasks):
+            for key, (count, examples) in batch.items():
+                entry = report.setdefault(key, [0, []])
+                entry[0] += count
+                # examples closest to equator are kept, they show where failures begin
+                entry[1] = sorted(entry[1] + examples, key=lambda e: (abs(e[0]), e))[:MAX_EXAMPLES]
+
+    print(f'Done in {time.perf_counter() - started:.1f} s')
+    return dict((k, tuple(v)) for k, v in sorted(report.items()))
+
+
+def print_report(report: dict):
+    if not report:
+        print('No invariant violations found')
+        return
+    for (theme, variant, violation), (count, examples) in report.items():
+        print(f'[{theme} / {variant}] {violation}: {count} combinations')
+        for lat, lon, tz, day in examples:
+            print(f'\tlat: {lat}, lon: {lon}, timezone: {tz:+g}, date: {day}')
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--theme', action='append', dest='themes', metavar='THEME_DIR',
+                        help='theme to validate, can be repeated (default: all themes)')
+    parser.add_argument('--lat-step', type=float, default=LAT_STEP, metavar='DEGREES',
+                        help='latitude grid step (default: %(default)s)')
+    parser.add_argument('--lon-step', type=float, default=LON_STEP, metavar='DEGREES',
+                        help='longitude grid step (default: %(default)s)')
+    parser.add_argument('--year', type=int, default=None, help='swept year (default: current year)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+
+
+def run(args: argparse.Namespace) -> int:
+    report = sweep(args.themes, args.lat_step, args.lon_step,
+                   year=args.year, workers=args.workers)
+    print_report(report)
+    return 1 if report else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog=f'{NAME.lower()}-sweep', description=DESCRIPTION)
+    add_arguments(parser)
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,250 @@
+#!/bin/python3
+
+import os
+import json
+import fcntl
+import struct
+import hashlib
+
+from definitions.dirs import BLOBSTORE_DIR, THEMES_DIR
+
+"""
+Optional content-addressed store of theme images\n
+Every unique image is stored once as BLOBSTORE_DIR/<sha256[:2]>/<sha256>
+and theme files become reflinks (copy-on-write, btrfs, xfs) or, where reflinks
+are not supported, read-only hardlinks of it, so identical images shared
+between themes take disk space (and with hardlinks page cache) only once.
+Per theme manifest maps image filenames to blob digests, which lets themes
+reference images present only in the store
+"""
+
+MANIFEST_FILE = '.blobs.json'
+HASH_CHUNK_SIZE = 1 << 20
+FICLONE = 0x40049409  # linux ioctl: share extents of whole file (btrfs, xfs)
+FS_IOC_FIEMAP = 0xC020660B  # linux ioctl: map file extents
+FIEMAP_FLAG_SYNC = 0x1
+FIEMAP_EXTENT_SHARED = 0x2000
+FIEMAP_HEADER = struct.Struct('=QQIIII')  # start, length, flags, mapped extents, extent count, reserved
+FIEMAP_EXTENT_SIZE = 56
+FIEMAP_EXTENT_FLAGS_OFFSET = 40
+
+LINK_HARDLINK = 'hardlink'
+LINK_REFLINK = 'reflink'
+
+# hardlinked files share inode with blob, editing one in place would change every theme using it
+HARDLINK_MODE = 0o444
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def blob_path(digest: str) -> str:
+    return os.path.join(BLOBSTORE_DIR, digest[:2], digest)
+
+
+def load_manifest(theme_dirpath: str) -> dict:
+    try:
+        with open(os.path.join(theme_dirpath, MANIFEST_FILE), 'r') as f:
+            return json.load(f)
+    except IOError:
+        pass
+    except json.JSONDecodeError:
+        print("Error occurred while trying to parse JSON file: ",
+              os.path.join(theme_dirpath, MANIFEST_FILE))
+    return {}
+
+
+def save_manifest(theme_dirpath: str, manifest: dict) -> bool:
+    manifest_path = os.path.join(theme_dirpath, MANIFEST_FILE)
+    try:
+        with open(f'{manifest_path}.tmp', 'w') as f:
+            json.dump(manifest, f, indent=4, sort_keys=True)
+        os.replace(f'{manifest_path}.tmp', manifest_path)
+        return True
+    except IOError:
+        print("Could not write file: ", manifest_path)
+    return False
+
+
+def resolve(img_path: str, manifest: dict) -> str:
+    '''
+    \nReturns: img_path if it exists, otherwise its blob path (if stored), otherwise img_path
+    '''
+    if os.path.exists(img_path):
+        return img_path
+    digest = manifest.get(os.path.basename(img_path))
+    if digest is not None and os.path.exists(blob_path(digest)):
+        return blob_path(digest)
+    return img_path
+
+
+def __reflink(src_path: str, dst_path: str) -> bool:
+    try:
+        with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst_path):
+            os.remove(dst_path)
+    return False
+
+
+def __extents_shared(path: str) -> bool:
+    # first extent of file is shared with another file (reflink), False where FIEMAP is not supported
+    request = bytearray(FIEMAP_HEADER.pack(0, 0xFFFFFFFFFFFFFFFF, FIEMAP_FLAG_SYNC, 0, 1, 0)
+                        + bytes(FIEMAP_EXTENT_SIZE))
+    try:
+        with open(path, 'rb') as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, request, True)
+    except OSError:
+        return False
+    if not FIEMAP_HEADER.unpack_from(request)[3]:
+        return False
+    flags, = struct.unpack_from('=I', request, FIEMAP_HEADER.size + FIEMAP_EXTENT_FLAGS_OFFSET)
+    return bool(flags & FIEMAP_EXTENT_SHARED)
+
+
+def __share(src_path: str, dst_path: str) -> str:
+    '''
+    \nMake dst_path share data with src_path, dst_path is replaced atomically\n
+    Reflink keeps files independent (copy-on-write), hardlink is only a fallback
+    and makes shared inode read-only\n
+    Returns: link type or empty string when filesystem supports neither hardlinks nor reflinks
+    '''
+    tmp_path = f'{dst_path}.blob-tmp'
+    if __reflink(src_path, tmp_path):
+        # reflink keeps modification time of blob, see __is_shared()
+        src_stat = os.stat(src_path)
+        os.utime(tmp_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        link_type = LINK_REFLINK
+    else:
+        try:
+            os.link(src_path, tmp_path)
+            os.chmod(tmp_path, HARDLINK_MODE)
+        except OSError:
+            return ''
+        link_type = LINK_HARDLINK
+
+    os.replace(tmp_path, dst_path)
+    return link_type
+
+
+def __is_shared(img_path: str, blob: str) -> bool:
+    # hardlink is the same inode, reflink has shared extents and modification time of blob
+    # (see __share(), editing file in place changes its modification time)
+    try:
+        img_stat, blob_stat = os.stat(img_path), os.stat(blob)
+    except OSError:
+        return False
+    if os.path.samestat(img_stat, blob_stat):
+        return True
+    return (img_stat.st_size == blob_stat.st_size and img_stat.st_mtime_ns == blob_stat.st_mtime_ns
+            and __extents_shared(img_path))
+
+
+def dedupe(theme_dirpaths=None) -> dict:
+    '''
+    \nMove images of given themes (default: all valid themes) into blob store
+    and replace duplicates with links to stored blobs\n
+    Returns: report dict with keys: files, blobs, linked, saved_bytes,
+    read_only (hardlinked theme files, made read-only)
+    '''
+    from utils.theme import list_valid_themes, WallpaperTheme
+    from utils.misc import flatten
+
+    if theme_dirpaths is None:
+        theme_dirpaths = [os.path.join(THEMES_DIR, t)
+                          for t in list_valid_themes()]
+
+    report = {'files': 0, 'blobs': 0, 'linked': 0, 'saved_bytes': 0, 'read_only': 0}
+
+    for theme_dirpath in map(os.path.abspath, theme_dirpaths):
+        theme = WallpaperTheme()
+        if not theme.open(theme_dirpath):
+            continue
+
+        manifest = load_manifest(theme_dirpath)
+        images = sorted(set(flatten(theme.filelist_all().values())))
+
+        for img_path in images:
+            # missing files are already resolved through the store
+            if not os.path.isfile(img_path) or os.path.dirname(img_path) != theme_dirpath:
+                continue
+            report['files'] += 1
+
+            filename = os.path.basename(img_path)
+            digest = manifest.get(filename)
+            if digest is not None and __is_shared(img_path, blob_path(digest)):
+                continue
+
+            digest = file_digest(img_path)
+            blob = blob_path(digest)
+            manifest[filename] = digest
+
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                link_type = __share(img_path, blob)
+                if link_type:
+                    report['blobs'] += 1
+                    report['read_only'] += link_type == LINK_HARDLINK
+                continue
+
+            if __is_shared(img_path, blob):
+                continue
+
+            size = os.stat(img_path).st_size
+            link_type = __share(blob, img_path)
+            if link_type:
+                report['linked'] += 1
+                report['saved_bytes'] += size
+                report['read_only'] += link_type == LINK_HARDLINK
+            else:
+                print(f'Cannot link {img_path}, filesystem supports neither hardlinks nor reflinks')
+
+        save_manifest(theme_dirpath, manifest)
+
+    return report
+
+
+def gc() -> dict:
+    '''
+    \nRemove blobs which are neither linked from any theme directory
+    nor referenced by any theme manifest\n
+    Returns: report dict with keys: removed, freed_bytes
+    '''
+    referenced = set()
+    if os.path.isdir(THEMES_DIR):
+        for theme_dir in os.listdir(THEMES_DIR):
+            referenced.update(load_manifest(
+                os.path.join(THEMES_DIR, theme_dir)).values())
+
+    report = {'removed': 0, 'freed_bytes': 0}
+    if not os.path.isdir(BLOBSTORE_DIR):
+        return report
+
+    for prefix in os.listdir(BLOBSTORE_DIR):
+        prefix_dirpath = os.path.join(BLOBSTORE_DIR, prefix)
+        if not os.path.isdir(prefix_dirpath):
+            continue
+
+        for digest in os.listdir(prefix_dirpath):
+            blob = os.path.join(prefix_dirpath, digest)
+            stat = os.stat(blob)
+            if digest in referenced or stat.st_nlink > 1:
+                continue
+            try:
+                os.remove(blob)
+                report['removed'] += 1
+                report['freed_bytes'] += stat.st_size
+            except OSError as e:
+                print(f'Error: {blob}, {e.strerror}')
+
+        if not os.listdir(prefix_dirpath):
+            os.rmdir(prefix_dirpath)
+
+    return report
@@ -0,0 +1,109 @@
+#!/bin/python3
+
+import json
+import time
+
+import utils.gnome_theming as gt
+import definitions.desktop as desktopdef
+from utils.profiling import profiled
+from definitions.dirs import DESKTOP_PROFILES_FILE
+
+# used for settings missing in profiles file, empty value means setting is not managed
+DEFAULT_PROFILES = {
+    desktopdef.PROFILE_LIGHT: {desktopdef.GTK_THEME: 'Pop', desktopdef.SHELL_THEME: 'Pop',
+                               desktopdef.CURSOR_THEME: 'xcursor-breeze-snow'},
+    desktopdef.PROFILE_DARK: {desktopdef.GTK_THEME: 'Pop-dark', desktopdef.SHELL_THEME: 'Pop-dark',
+                              desktopdef.CURSOR_THEME: 'xcursor-breeze'},
+}
+
+# org.gnome.desktop.interface keys of profile settings
+INTERFACE_KEYS = {desktopdef.GTK_THEME: gt.KEY_GTK_THEME, desktopdef.CURSOR_THEME: gt.KEY_CURSOR_THEME,
+                  desktopdef.ICON_THEME: gt.KEY_ICON_THEME, desktopdef.COLOR_SCHEME: gt.KEY_COLOR_SCHEME}
+
+WRITERS = {desktopdef.GTK_THEME: gt.change_gtk_theme, desktopdef.SHELL_THEME: gt.change_shell_theme,
+           desktopdef.CURSOR_THEME: gt.change_cursor_theme, desktopdef.ICON_THEME: gt.change_icon_theme,
+           desktopdef.COLOR_SCHEME: gt.change_color_scheme}
+
+WRITE_INTERVAL_SEC = 0.1
+
+
+def __available_values(setting: str) -> set:
+    if setting == desktopdef.GTK_THEME:
+        themes = gt.list_gtk_themes()
+    elif setting == desktopdef.SHELL_THEME:
+        themes = gt.list_shell_themes()
+    elif setting == desktopdef.CURSOR_THEME:
+        themes = gt.list_cursor_themes()
+    elif setting == desktopdef.ICON_THEME:
+        themes = gt.list_icon_themes()
+    else:
+        return set(gt.COLOR_SCHEMES)
+    return set(name for name, _ in themes)
+
+
+def validate_profile(profile: dict) -> dict:
+    '''
+    \nDrop unmanaged settings and themes which are not installed\n
+    Returns: profile with valid settings only
+    '''
+    valid = {}
+    for setting in desktopdef.SETTINGS:
+        value = profile.get(setting, '')
+        if not value:
+            continue
+        if setting == desktopdef.COLOR_SCHEME and gt.KEY_COLOR_SCHEME not in gt.get_interface_settings():
+            # color-scheme key exists since GNOME 42, writing it fails on every theme change
+            print(f'WARNING: {setting} is not supported by this GNOME version, setting will not be changed')
+            continue
+        if value not in __available_values(setting):
+            print(f'WARNING: {setting} "{value}" is not installed, setting will not be changed')
+            continue
+        valid[setting] = value
+    return valid
+
+
+def load_profiles(profiles_path=DESKTOP_PROFILES_FILE) -> dict:
+    '''
+    \nRead light and dark desktop profiles (missing settings are taken from DEFAULT_PROFILES)\n
+    Returns: dict( profile name -> validated profile dict )
+    '''
+    profiles = dict((p, dict(DEFAULT_PROFILES[p])) for p in desktopdef.PROFILES)
+    try:
+        with open(profiles_path, 'r') as f:
+            config = json.load(f)
+        for profile in desktopdef.PROFILES:
+            profiles[profile].update(config.get(profile, {}))
+    except IOError:
+        pass
+    except json.JSONDecodeError:
+        print("Error occurred while trying to parse JSON file: ", profiles_path)
+
+    return dict((p, validate_profile(profiles[p])) for p in desktopdef.PROFILES)
+
+
+def read_current_settings(settings) -> dict:
+    current = {}
+    if any(s in INTERFACE_KEYS for s in settings):
+        interface = gt.get_interface_settings()
+        for setting, key in INTERFACE_KEYS.items():
+            current[setting] = interface.get(key, '')
+    if desktopdef.SHELL_THEME in settings:
+        current[desktopdef.SHELL_THEME] = gt.get_shell_theme()
+    return current
+
+
+@profiled()
+def apply_profile(profile: dict) -> list:
+    '''
+    \nRead current desktop settings once and write only those which differ from profile\n
+    Returns: list of changed settings
+    '''
+    current = read_current_settings(profile.keys())
+    changed = [s for s in desktopdef.SETTINGS if s in profile and profile[s] != current.get(s)]
+
+    for i, setting in enumerate(changed):
+        if i > 0:
+            time.sleep(WRITE_INTERVAL_SEC)
+        WRITERS[setting](profile[setting])
+
+    return changed
@@ -1,10 +1,12 @@
 #!/bin/python3
 
 import os
-import re
+import ast
 import subprocess
 from itertools import repeat
 
+from utils.profiling import profiled
+
 SYSTEM_WINDOW_THEMES = '/usr/share/themes'
 SYSTEM_ICON_THEMES = '/usr/share/icons'
 USER_WINDOW_THEMES = os.path.expanduser('~/.themes')
@@ -16,51 +18,126 @@ ICON_DIRS = set(('8x8', '16x16', '32x32', '64x64',
 SHELL_DIR = 'gnome-shell'
 CURSOR_DIR = 'cursors'
 
+INTERFACE_SCHEMA = 'org.gnome.desktop.interface'
+KEY_GTK_THEME = 'gtk-theme'
+KEY_CURSOR_THEME = 'cursor-theme'
+KEY_ICON_THEME = 'icon-theme'
+KEY_COLOR_SCHEME = 'color-scheme'
+COLOR_SCHEMES = ('default', 'prefer-dark', 'prefer-light')
+
+SHELL_SCHEMA = 'org.gnome.shell.extensions.user-theme'
+KEY_SHELL_THEME = 'name'
+
+BACKGROUND_SCHEMA = 'org.gnome.desktop.background'
+KEY_PICTURE_URI = 'picture-uri'
+KEY_PICTURE_OPTIONS = 'picture-options'
+
+PICTURE_ZOOM = 'zoom'  # GNOME default
+PICTURE_SPANNED = 'spanned'
+
+
+def __parse_gvariant(text: str) -> str:
+    # gsettings prints values in GVariant text format, strings are quoted and escaped (eg. 'Adwaita Dark+')
+    text = text.strip()
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+    return value if isinstance(value, str) else text
+
+
+def __gvariant_string(value: str) -> str:
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def __gsettings_get(schema: str, key: str) -> str:
+    try:
+        output = subprocess.run(['gsettings', 'get', schema, key],
+                                capture_output=True, text=True).stdout
+    except OSError as e:
+        print(f'Cannot run gsettings, {e.strerror}')
+        return ''
+    return __parse_gvariant(output)
+
 
-def __convert_to_simple_string(text: str) -> str:
-    return re.compile(r'[^a-zA-Z0-9_/.-]+', re.UNICODE).sub('', text)
+def __gsettings_set(schema: str, key: str, value: str):
+    # argument list, values from config files never reach a shell
+    try:
+        subprocess.call(['gsettings', 'set', schema, key, __gvariant_string(value)])
+    except OSError as e:
+        print(f'Cannot run gsettings, {e.strerror}')
 
 
+@profiled()
 def get_gtk_theme() -> str:
-    cmd = 'gsettings get org.gnome.desktop.interface gtk-theme'
-    theme, _ = subprocess.Popen(
-        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, shell=True).communicate()
-    return __convert_to_simple_string(theme)
+    return __gsettings_get(INTERFACE_SCHEMA, KEY_GTK_THEME)
 
 
+@profiled()
 def get_shell_theme() -> str:
-    cmd = 'gsettings get org.gnome.shell.extensions.user-theme name'
-    theme, _ = subprocess.Popen(
-        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, text=True).communicate()
-    return __convert_to_simple_string(theme)
+    return __gsettings_get(SHELL_SCHEMA, KEY_SHELL_THEME)
+
+
+@profiled()
+def get_interface_settings() -> dict:
+    '''
+    \nRead all org.gnome.desktop.interface keys with single gsettings call\n
+    Returns: dict( key: str -> value: str )
+    '''
+    try:
+        output = subprocess.run(['gsettings', 'list-recursively', INTERFACE_SCHEMA],
+                                capture_output=True, text=True).stdout
+    except OSError as e:
+        print(f'Cannot run gsettings, {e.strerror}')
+        return {}
+
+    settings = {}
+    for line in output.splitlines():
+        fields = line.split(' ', 2)
+        if len(fields) == 3:
+            settings[fields[1]] = __parse_gvariant(fields[2])
+    return settings
 
 
+@profiled()
 def get_wallpaper() -> str:
-    cmd = 'gsettings get org.gnome.desktop.background picture-uri'
-    wallpaper, _ = subprocess.Popen(
-        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, text=True).communicate()
-    return __convert_to_simple_string(wallpaper)
+    return __gsettings_get(BACKGROUND_SCHEMA, KEY_PICTURE_URI)
 
 
+@profiled()
 def change_gtk_theme(theme_name: str):
-    subprocess.call(
-        f'gsettings set org.gnome.desktop.interface gtk-theme {theme_name}', shell=True)
+    __gsettings_set(INTERFACE_SCHEMA, KEY_GTK_THEME, theme_name)
 
 
+@profiled()
 def change_cursor_theme(theme_name: str):
-    subprocess.call(
-        f'gsettings set org.gnome.desktop.interface cursor-theme {theme_name}', shell=True)
+    __gsettings_set(INTERFACE_SCHEMA, KEY_CURSOR_THEME, theme_name)
 
 
+@profiled()
+def change_icon_theme(theme_name: str):
+    __gsettings_set(INTERFACE_SCHEMA, KEY_ICON_THEME, theme_name)
+
+
+@profiled()
+def change_color_scheme(color_scheme: str):
+    __gsettings_set(INTERFACE_SCHEMA, KEY_COLOR_SCHEME, color_scheme)
+
+
+@profiled()
 def change_shell_theme(theme_name: str):
-    subprocess.call(
-        f'gsettings set org.gnome.shell.extensions.user-theme name {theme_name}', shell=True)
+    __gsettings_set(SHELL_SCHEMA, KEY_SHELL_THEME, theme_name)
 
 
+@profiled()
 def change_wallpaper(wallpaper_path: str):
     wallpaper_path = os.path.abspath(wallpaper_path)
-    subprocess.call(
-        f'gsettings set org.gnome.desktop.background picture-uri "file:///{wallpaper_path}"', shell=True)
+    __gsettings_set(BACKGROUND_SCHEMA, KEY_PICTURE_URI, f'file:///{wallpaper_path}')
+
+
+@profiled()
+def change_picture_options(picture_options: str):
+    __gsettings_set(BACKGROUND_SCHEMA, KEY_PICTURE_OPTIONS, picture_options)
 
 
 def get_themes(dirpath: str) -> list:
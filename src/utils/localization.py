@@ -1,13 +1,9 @@
 #!/bin/python3
 
-import gi
 import time
 from datetime import datetime
 from multiprocessing.pool import ThreadPool
 
-gi.require_version('Geoclue', '2.0')
-from gi.repository import Geoclue
-
 TIMEOUT = 5  # geolocation request timeout in seconds
 INTERVAL = 0.01
 
@@ -26,6 +22,11 @@ def get_geolocation() -> tuple:
     or localization features disabled in system privacy settings
     '''
     def __get_location(_) -> tuple:
+        # Geoclue is loaded on first request, timing engine runs without it (eg. sweep in headless CI)
+        import gi
+        gi.require_version('Geoclue', '2.0')
+        from gi.repository import Geoclue
+
         clue = Geoclue.Simple.new_sync(
             'localization', Geoclue.AccuracyLevel.NEIGHBORHOOD, None)
         location = clue.get_location()
@@ -0,0 +1,180 @@
+#!/bin/python3
+
+import os
+import json
+import numpy as np
+from PIL import Image
+from typing import Optional
+
+import definitions.theme as themedef
+from utils.misc import flatten
+from utils.theme import list_valid_themes, WallpaperTheme
+from definitions.dirs import THEMES_DIR, LUMINANCE_INDEX_FILE
+
+ANALYSIS_SIZE = (256, 144)
+HISTOGRAM_BINS = 16
+
+# relative luminance (0.0 - 1.0) below which an imported image is considered dark (night)
+DARK_THRESHOLD = 0.25
+
+# desktop follows wallpaper of current theme: frame is dark below midpoint between brightest
+# night image and darkest image of other daytimes, state changes only when frame leaves
+# hysteresis band around it (half width is this fraction of distance of the two images)
+HYSTERESIS_RATIO = 0.25
+
+# Rec. 709 luma coefficients
+LUMA_WEIGHTS = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+KEY_MTIME = "mtime"
+KEY_LUMINANCE = "luminance"
+KEY_MEDIAN = "median"
+KEY_CONTRAST = "contrast"
+KEY_MEAN_RGB = "mean_rgb"
+KEY_HISTOGRAM = "histogram"
+
+
+def analyze_image(img_path: str) -> dict:
+    '''
+    \nCompute luminance and colour statistics of an image\n
+    Image is decoded at reduced scale (JPEG draft mode) so full
+    resolution pixels are never materialized\n
+    Returns: dict with keys: luminance, median, contrast, mean_rgb, histogram
+    '''
+    with Image.open(img_path) as img:
+        img.draft('RGB', ANALYSIS_SIZE)
+        img = img.convert('RGB')
+        img.thumbnail(ANALYSIS_SIZE)
+        pixels = np.asarray(img, dtype=np.float32).reshape(-1, 3) / 255
+
+    luma = pixels @ LUMA_WEIGHTS
+    histogram, _ = np.histogram(luma, bins=HISTOGRAM_BINS, range=(0.0, 1.0))
+
+    return {KEY_LUMINANCE: round(float(luma.mean()), 4),
+            KEY_MEDIAN: round(float(np.median(luma)), 4),
+            KEY_CONTRAST: round(float(luma.std()), 4),
+            KEY_MEAN_RGB: pixels.mean(axis=0).round(4).tolist(),
+            KEY_HISTOGRAM: (histogram / luma.size).round(4).tolist()}
+
+
+def list_theme_images(theme_dirpaths: list) -> list:
+    images = []
+    for theme_dirpath in theme_dirpaths:
+        theme = WallpaperTheme()
+        if theme.open(theme_dirpath):
+            images += flatten(theme.filelist_all().values())
+    return sorted(set(images))
+
+
+class LuminanceIndex:
+    def __init__(self, index_path=LUMINANCE_INDEX_FILE):
+        self.__index_path = index_path
+        self.__entries = {}
+
+    def load(self) -> bool:
+        try:
+            with open(self.__index_path, 'r') as f:
+                self.__entries = json.load(f)
+            return True
+        except IOError:
+            pass
+        except json.JSONDecodeError:
+            print("Error occurred while trying to parse JSON file: ",
+                  self.__index_path)
+        self.__entries = {}
+        return False
+
+    def save(self) -> bool:
+        try:
+            os.makedirs(os.path.dirname(self.__index_path), exist_ok=True)
+            tmp_path = f'{self.__index_path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.__entries, f)
+            os.replace(tmp_path, self.__index_path)
+            return True
+        except IOError:
+            print("Could not write file: ", self.__index_path)
+        return False
+
+    def update(self, theme_dirpaths=None) -> int:
+        '''
+        \nAnalyze every image of given themes (default: all valid themes)
+        which is missing from the index or was modified since last analysis\n
+        Returns: number of (re)analyzed images
+        '''
+        if theme_dirpaths is None:
+            theme_dirpaths = [os.path.join(THEMES_DIR, t)
+                              for t in list_valid_themes()]
+
+        images = list_theme_images(theme_dirpaths)
+        updated = 0
+
+        for img_path in images:
+            try:
+                mtime = os.stat(img_path).st_mtime
+            except OSError:
+                continue
+
+            entry = self.__entries.get(img_path)
+            if entry is not None and entry[KEY_MTIME] == mtime:
+                continue
+
+            try:
+                entry = analyze_image(img_path)
+            except IOError:
+                print("Cannot analyze image:", img_path)
+                continue
+
+            entry[KEY_MTIME] = mtime
+            self.__entries[img_path] = entry
+            updated += 1
+
+        stale = [p for p in self.__entries if not os.path.exists(p)]
+        for img_path in stale:
+            del self.__entries[img_path]
+
+        if updated or stale:
+            self.save()
+
+        return updated
+
+    def stats(self, img_path: str) -> dict:
+        return self.__entries.get(img_path, {})
+
+    def luminance(self, img_path: str) -> Optional[float]:
+        entry = self.__entries.get(img_path)
+        if entry is None:
+            return None
+        return entry[KEY_LUMINANCE]
+
+    def theme_threshold(self, daytime_files: dict) -> Optional[tuple]:
+        '''
+        \nDark threshold of theme: midpoint between its brightest night image and
+        darkest image of other daytimes (absolute luminance differs a lot between themes)\n
+        daytime_files: dict( daytime -> list of image paths ), see WallpaperTheme.filelist_all()\n
+        Returns: tuple( threshold, half width of hysteresis band ), None when any image is not
+        analyzed or night and day images can not be told apart
+        '''
+        night = [self.luminance(p) for p in daytime_files.get(themedef.FL_NIGHT, [])]
+        lit = [self.luminance(p) for d, files in daytime_files.items()
+               if d != themedef.FL_NIGHT for p in files]
+        if not night or not lit or None in night + lit:
+            return None
+        night_max, lit_min = max(night), min(lit)
+        if night_max == lit_min:
+            return None
+        return (night_max + lit_min) / 2, abs(lit_min - night_max) * HYSTERESIS_RATIO
+
+    def is_dark(self, img_path: str, daytime_files: dict, was_dark=False) -> Optional[bool]:
+        '''
+        \nIs image dark relative to other images of its theme (daytime_files)\n
+        was_dark: current state, it is kept while luminance stays within hysteresis band\n
+        Returns: None when threshold of theme is unknown
+        '''
+        lum = self.luminance(img_path)
+        threshold = self.theme_threshold(daytime_files)
+        if lum is None or threshold is None:
+            return None
+        threshold, band = threshold
+        if was_dark:
+            return lum < threshold + band
+        return lum < threshold - band
@@ -10,6 +10,14 @@ def flatten(lst: Collection) -> list:
     return [item for sublist in lst for item in sublist]
 
 
+def format_size(size_bytes: float) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(size_bytes) < 1024 or unit == 'GiB':
+            break
+        size_bytes /= 1024
+    return f'{size_bytes:.1f} {unit}'
+
+
 # ----------------------- timezone ----------------------------
 
 def local_tzoffset() -> float:
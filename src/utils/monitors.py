@@ -0,0 +1,87 @@
+#!/bin/python3
+
+import re
+import json
+import hashlib
+import subprocess
+
+import definitions.layout as layoutdef
+from definitions.dirs import MONITOR_LAYOUT_FILE
+
+# eg. "DP-1 connected primary 2560x1440+1920+0 (normal left inverted right x axis y axis) 597mm x 336mm"
+XRANDR_OUTPUT = re.compile(
+    r'^(\S+) connected (?:primary )?(\d+)x(\d+)\+(\d+)\+(\d+)')
+
+
+def read_xrandr_outputs() -> list:
+    '''
+    \nActive outputs from current X server configuration (no output probing, which stalls the session)\n
+    Returns: list of active output dicts (name, x, y, width, height), empty list when xrandr fails
+    '''
+    try:
+        output = subprocess.run(['xrandr', '--current'], capture_output=True,
+                                text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+
+    outputs = []
+    for line in output.splitlines():
+        match = XRANDR_OUTPUT.match(line)
+        if match:
+            name, width, height, x, y = match.groups()
+            outputs.append({layoutdef.OUT_NAME: name, layoutdef.OUT_X: int(x), layoutdef.OUT_Y: int(y),
+                            layoutdef.OUT_WIDTH: int(width), layoutdef.OUT_HEIGHT: int(height)})
+    return outputs
+
+
+def __normalize_outputs(outputs: list) -> list:
+    # canvas origin is top left corner of bounding box, order does not depend on config or xrandr
+    min_x = min(o[layoutdef.OUT_X] for o in outputs)
+    min_y = min(o[layoutdef.OUT_Y] for o in outputs)
+    normalized = [{layoutdef.OUT_NAME: str(o.get(layoutdef.OUT_NAME, '')),
+                   layoutdef.OUT_X: o[layoutdef.OUT_X] - min_x, layoutdef.OUT_Y: o[layoutdef.OUT_Y] - min_y,
+                   layoutdef.OUT_WIDTH: o[layoutdef.OUT_WIDTH], layoutdef.OUT_HEIGHT: o[layoutdef.OUT_HEIGHT]}
+                  for o in outputs]
+    return sorted(normalized, key=lambda o: (o[layoutdef.OUT_X], o[layoutdef.OUT_Y], o[layoutdef.OUT_NAME]))
+
+
+def load_layout(layout_path=MONITOR_LAYOUT_FILE):
+    '''
+    \nRead monitor layout config, outputs missing in config are read from xrandr\n
+    Returns: layout dict (mode, outputs) or None when compositing is not configured
+    or outputs are unknown
+    '''
+    try:
+        with open(layout_path, 'r') as f:
+            config = json.load(f)
+    except IOError:
+        return None
+    except json.JSONDecodeError:
+        print("Error occurred while trying to parse JSON file: ", layout_path)
+        return None
+
+    mode = config.get(layoutdef.MODE, layoutdef.MODE_SPAN)
+    if mode not in layoutdef.MODES:
+        print(f'Invalid monitor layout mode: {mode}, expected one of: {layoutdef.MODES}')
+        return None
+
+    outputs = config.get(layoutdef.OUTPUTS) or read_xrandr_outputs()
+    valid = all(isinstance(o.get(k), int) for o in outputs for k in layoutdef.OUTPUT_GEOMETRY) and all(
+        o[layoutdef.OUT_WIDTH] > 0 and o[layoutdef.OUT_HEIGHT] > 0 for o in outputs)
+    if not outputs or not valid:
+        print(f'Invalid or unknown monitor outputs: {outputs}')
+        return None
+
+    return {layoutdef.MODE: mode, layoutdef.OUTPUTS: __normalize_outputs(outputs)}
+
+
+def layout_hash(layout) -> str:
+    if layout is None:
+        return ''
+    return hashlib.sha1(json.dumps(layout, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def canvas_size(layout: dict) -> tuple:
+    outputs = layout[layoutdef.OUTPUTS]
+    return (max(o[layoutdef.OUT_X] + o[layoutdef.OUT_WIDTH] for o in outputs),
+            max(o[layoutdef.OUT_Y] + o[layoutdef.OUT_HEIGHT] for o in outputs))
@@ -0,0 +1,67 @@
+#!/bin/python3
+
+import os
+import subprocess
+
+# can be pointed to a directory with the same layout (eg. for tests)
+POWER_SUPPLY_DIR = os.environ.get(
+    'WALLMATIC_POWER_SUPPLY_DIR', '/sys/class/power_supply')
+
+SUPPLY_TYPE_BATTERY = 'Battery'
+SUPPLY_TYPES_EXTERNAL = ('Mains', 'USB', 'USB_C', 'USB_PD')
+BATTERY_DISCHARGING = 'Discharging'
+
+
+def __read_attribute(supply_dirpath: str, attribute: str) -> str:
+    try:
+        with open(os.path.join(supply_dirpath, attribute), 'r') as f:
+            return f.read().strip()
+    except IOError:
+        return ''
+
+
+def __on_battery_sysfs(power_supply_dir: str):
+    try:
+        supplies = [os.path.join(power_supply_dir, d)
+                    for d in os.listdir(power_supply_dir)]
+    except OSError:
+        return None
+
+    batteries_discharging = False
+    for supply in supplies:
+        supply_type = __read_attribute(supply, 'type')
+        if supply_type in SUPPLY_TYPES_EXTERNAL and __read_attribute(supply, 'online') == '1':
+            return False
+        if supply_type == SUPPLY_TYPE_BATTERY and __read_attribute(supply, 'status') == BATTERY_DISCHARGING:
+            batteries_discharging = True
+
+    return batteries_discharging
+
+
+def __on_battery_upower():
+    try:
+        output, _ = subprocess.Popen(
+            ['upower', '-d'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).communicate()
+    except OSError:
+        return None
+
+    for line in output.splitlines():
+        key, _, value = line.partition(':')
+        if key.strip() == 'on-battery':
+            return value.strip() == 'yes'
+    return None
+
+
+def on_battery(power_supply_dir=None) -> bool:
+    '''
+    \nCheck if system is running on battery power\n
+    Reads power supplies from sysfs, falls back to UPower when sysfs is not available\n
+    Returns: False when state is unknown (eg. desktop computers)
+    '''
+    if power_supply_dir is None:
+        power_supply_dir = POWER_SUPPLY_DIR
+
+    status = __on_battery_sysfs(power_supply_dir)
+    if status is None:
+        status = __on_battery_upower()
+    return bool(status)
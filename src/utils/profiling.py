@@ -0,0 +1,207 @@
+#!/bin/python3
+
+import io
+import atexit
+import os
+import sys
+import time
+import heapq
+import pstats
+import signal
+import marshal
+import cProfile
+import threading
+import tracemalloc
+from functools import wraps
+from datetime import datetime
+
+from definitions.dirs import PROFILING_DIR
+
+"""
+Opt-in profiling mode, enabled with WALLMATIC_PROFILE=1 environment variable
+or --profile command line flag\n
+When enabled: functions decorated with @profiled() are timed, every thread
+entering a profiled function gets its own cProfile profiler (single process-wide
+profiler since Python 3.12), tracemalloc is
+started and SIGUSR1 dumps all captured data into PROFILING_DIR\n
+When disabled: @profiled() returns the decorated function unchanged
+"""
+
+ENV_PROFILE = 'WALLMATIC_PROFILE'
+FLAG_PROFILE = '--profile'
+
+# decided once at import time, so disabled profiling adds no wrappers at all
+ENABLED = os.environ.get(ENV_PROFILE, '') not in ('', '0') or FLAG_PROFILE in sys.argv
+
+SLOWEST_SPANS = 50  # amount of slowest operations kept in rolling trace
+CPROFILE_TOP = 40
+TRACEMALLOC_TOP = 25
+TRACEMALLOC_FRAMES = 10
+
+__lock = threading.Lock()
+__slowest_spans = []  # min-heap of (duration, finished timestamp, span name, thread name)
+__profilers = {}  # thread name (or PROCESS_PROFILER) -> cProfile.Profile, None if it could not be started
+# set by SIGUSR1 handler, dump runs in its own thread: handler interrupts main thread
+# which may be holding __lock inside a profiled function
+__dump_requested = threading.Event()
+
+# since Python 3.12 cProfile uses sys.monitoring: only one profiler can be active
+# per interpreter and it already covers all threads
+PROCESS_WIDE_PROFILER = sys.version_info >= (3, 12)
+PROCESS_PROFILER = 'process'
+
+
+def __ensure_thread_profiler():
+    '''
+    Returns: newly started per-thread profiler (disabled by caller after outermost span)
+    or None if calling thread is already profiled, profiler is process-wide or cannot be started
+    '''
+    profiler_name = PROCESS_PROFILER if PROCESS_WIDE_PROFILER else threading.current_thread().name
+    with __lock:
+        if profiler_name in __profilers:
+            return None
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # another profiling tool is active, wrapped functions are still timed as spans
+            print(f'cProfile disabled for {profiler_name}: {e}')
+            profiler = None
+        __profilers[profiler_name] = profiler
+
+    if profiler is None:
+        return None
+    if PROCESS_WIDE_PROFILER:
+        # stays enabled for the whole process lifetime
+        atexit.register(profiler.disable)
+        return None
+    return profiler
+
+
+def __record_span(name: str, duration: float):
+    entry = (duration, time.time(), name, threading.current_thread().name)
+    with __lock:
+        if len(__slowest_spans) < SLOWEST_SPANS:
+            heapq.heappush(__slowest_spans, entry)
+        elif duration > __slowest_spans[0][0]:
+            heapq.heapreplace(__slowest_spans, entry)
+
+
+def profiled(name: str = None):
+    '''
+    \nDecorator wrapping function in a timing span (only in profiling mode)\n
+    name: span name, defaults to function qualified name
+    '''
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        span_name = name or f'{func.__module__}.{func.__qualname__}'
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = __ensure_thread_profiler()
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                __record_span(span_name, time.perf_counter() - started)
+                # outermost span of the thread, collected stats stay available for dump
+                if profiler is not None:
+                    profiler.disable()
+
+        return wrapper
+
+    return decorator
+
+
+def install() -> bool:
+    '''
+    \nStart profiling of calling (main) thread, tracemalloc and register SIGUSR1 dump handler\n
+    Returns: True if profiling mode is enabled
+    '''
+    if not ENABLED:
+        return False
+
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    profiler = __ensure_thread_profiler()
+    if profiler is not None:
+        atexit.register(profiler.disable)
+    threading.Thread(target=__dump_on_request, name='profiling-dump', daemon=True).start()
+    signal.signal(signal.SIGUSR1, lambda *_: __dump_requested.set())
+    print(f'Profiling mode enabled, send SIGUSR1 to process {os.getpid()} to dump profiling data into {PROFILING_DIR}')
+    return True
+
+
+def __dump_cprofile(dump_dir: str) -> list:
+    with __lock:
+        profilers = [(n, p) for n, p in __profilers.items() if p is not None]
+
+    paths = []
+    for thread_name, profiler in profilers:
+        # snapshot without disabling profiler, running threads stay profiled
+        profiler.snapshot_stats()
+        path = os.path.join(dump_dir, f'cprofile-{thread_name}.prof')
+        with open(path, 'wb') as f:
+            marshal.dump(profiler.stats, f)
+        paths.append(path)
+
+    if paths:
+        summary = io.StringIO()
+        stats = pstats.Stats(*paths, stream=summary)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(CPROFILE_TOP)
+        with open(os.path.join(dump_dir, 'cprofile-summary.txt'), 'w') as f:
+            f.write(summary.getvalue())
+
+    return paths
+
+
+def __dump_tracemalloc(dump_dir: str):
+    if not tracemalloc.is_tracing():
+        return
+
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    with open(os.path.join(dump_dir, 'tracemalloc.txt'), 'w') as f:
+        f.write(f'current: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB\n\n')
+        for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]:
+            f.write(f'{stat}\n')
+
+
+def __dump_spans(dump_dir: str):
+    with __lock:
+        spans = sorted(__slowest_spans, reverse=True)
+
+    with open(os.path.join(dump_dir, 'slowest-spans.txt'), 'w') as f:
+        for duration, finished, name, thread_name in spans:
+            f.write(
+                f'{duration * 1000:10.2f} ms\t{datetime.fromtimestamp(finished).isoformat(timespec="seconds")}\t{thread_name}\t{name}\n')
+
+
+def __dump_on_request():
+    while True:
+        __dump_requested.wait()
+        __dump_requested.clear()
+        dump()
+
+
+def dump() -> str:
+    '''
+    \nWrite cProfile stats (one file per thread), tracemalloc top-N
+    and slowest operations trace into new timestamped directory\n
+    Returns: dump directory path (empty string on failure)
+    '''
+    dump_dir = os.path.join(
+        PROFILING_DIR, datetime.now().strftime('%Y%m%d-%H%M%S'))
+    try:
+        os.makedirs(dump_dir, exist_ok=True)
+        __dump_cprofile(dump_dir)
+        __dump_tracemalloc(dump_dir)
+        __dump_spans(dump_dir)
+    except OSError as e:
+        print(f'Failed to dump profiling data: {dump_dir}, {e.strerror}')
+        return ""
+
+    print(f'Profiling data saved to: {dump_dir}')
+    return dump_dir
@@ -0,0 +1,79 @@
+#!/bin/python3
+
+import os
+import json
+import socket
+
+import definitions.service as servicedef
+from definitions.dirs import SERVICE_SOCKET_FILE
+
+"""
+Client of shared schedule service (see service.py)\n
+On multi-user hosts one system service does geolocation and schedule XML
+generation for all sessions, every session only writes received schedules
+into its own WALLPAPER_XML_DIR and applies them with gsettings.
+Every request falls back to local computation (None is returned) when
+service is not running or fails
+"""
+
+# can be pointed to another socket (eg. service running in user session for tests)
+SOCKET_PATH = os.environ.get('WALLMATIC_SERVICE_SOCKET', SERVICE_SOCKET_FILE)
+
+TIMEOUT = 10  # seconds, schedule generation of uncached theme takes a while
+
+__socket_path = ''
+
+
+def enable(socket_path=SOCKET_PATH) -> bool:
+    '''
+    \nUse service listening on socket_path (if socket exists)\n
+    Returns: True if service will be used
+    '''
+    global __socket_path
+    __socket_path = socket_path if os.path.exists(socket_path) else ''
+    return enabled()
+
+
+def enabled() -> bool:
+    return bool(__socket_path)
+
+
+def request(message: dict):
+    '''
+    \nSend single request (one JSON line) and wait for reply\n
+    Returns: reply dict or None on any error
+    '''
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(TIMEOUT)
+            sock.connect(__socket_path)
+            sock.sendall(json.dumps(message).encode() + b'\n')
+            with sock.makefile('rb') as f:
+                reply = json.loads(f.readline())
+    except (OSError, ValueError) as e:
+        print(f'Schedule service is not available ({e}), computing locally')
+        return None
+
+    if servicedef.ERROR in reply:
+        print(f'Schedule service error: {reply[servicedef.ERROR]}, computing locally')
+        return None
+    return reply
+
+
+def fetch_location():
+    '''
+    \nReturns: tuple( latitude: float, longitude: float ) of service host or None
+    '''
+    reply = request({servicedef.REQUEST: servicedef.REQ_LOCATION})
+    if reply is None:
+        return None
+    return reply[servicedef.LAT], reply[servicedef.LON]
+
+
+def fetch_schedule(theme_dirpath: str, timezone: float, transition_time: int, days: int):
+    '''
+    \nReturns: schedule dict (see DynWallpaper.generate_wallpaper_xml) or None
+    '''
+    return request({servicedef.REQUEST: servicedef.REQ_SCHEDULE, servicedef.THEME: os.path.abspath(theme_dirpath),
+                    servicedef.TIMEZONE: timezone, servicedef.TRANSITION_TIME: transition_time,
+                    servicedef.DAYS: days})
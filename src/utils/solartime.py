@@ -71,10 +71,19 @@ def sol_noon(longitude, timezone, eqtime=eq_time()):
     return round(720 - 4 * longitude - eqtime + 60 * timezone) * 60
 
 
-def timetuple(latitude, longitude, timezone):
+def timetuple(latitude, longitude, timezone, date=None):
+    if date is None:
+        date = datetime.now()
+
+    fy = fractional_year(date)
+    eqt = eq_time(fy)
+    dec = sol_declination(fy)
+    ha = hour_angle_sunrise_sunset(latitude, dec)
+    ha_twilight = hour_angle_civil_twilight(latitude, dec)
+
     return (
-        sunrise(longitude, latitude, timezone), sol_noon(longitude, timezone),
-        sunset(longitude, latitude, timezone), civil_twilight(longitude, latitude, timezone))
+        sunrise(longitude, latitude, timezone, ha, eqt), sol_noon(longitude, timezone, eqt),
+        sunset(longitude, latitude, timezone, ha, eqt), civil_twilight(longitude, latitude, timezone, ha_twilight, eqt))
 
 
 def __get_daytime_dt(daytime_func, latitude: float, longitude: float, date: datetime, timezone: float) -> datetime:
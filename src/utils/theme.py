@@ -5,6 +5,7 @@ import os
 
 from definitions.dirs import THEMES_DIR
 import definitions.theme as themedef
+from utils.blobstore import load_manifest, resolve
 
 THEME_FILE = "theme.json"
 
@@ -42,7 +43,7 @@ class WallpaperTheme:
     def __init__(self):
         self.__theme_abspath = ''
         self.__themedict = {}
-        self.__img_path_template = ''
+        self.__filelists = {}  # daytime -> resolved image paths
         self.__opened = False
 
     def open(self, theme_dirpath: str) -> bool:
@@ -53,27 +54,40 @@ class WallpaperTheme:
             try:
                 with open(theme_json_path, 'r') as f:
                     theme = json.load(f)
+                # paths are resolved once, file lists are read on every daemon tick and render
+                img_path_template = os.path.join(
+                    theme_dirpath, theme[themedef.FILENAME])
+                blob_manifest = load_manifest(theme_dirpath)
+                self.__filelists = dict((d, [resolve(img_path_template.replace('*', str(x)), blob_manifest)
+                                             for x in theme[themedef.FILE_LIST][d]]) for d in themedef.DAYTIMES)
                 self.__opened = True
                 self.__theme_abspath = theme_dirpath
                 self.__themedict = theme
-                self.__img_path_template = os.path.join(
-                    theme_dirpath, theme[themedef.FILENAME])
                 return True
             except IOError:
                 print("Could not read file: ", theme_json_path)
             except json.JSONDecodeError:
                 print("Error occurred while trying to parse JSON file: ",
                       theme_json_path)
+            except KeyError as e:
+                print(f'Invalid theme file: {theme_json_path}, missing key: {e}')
 
         self.__opened = False
         self.__theme_abspath = ''
         self.__themedict = {}
-        self.__img_path_template = ''
+        self.__filelists = {}
         return False
 
+    def __filelist(self, daytime: str) -> list:
+        # images missing in theme directory are resolved through blob store (see open())
+        return list(self.__filelists[daytime])
+
     def ready(self) -> bool:
         return self.__opened
 
+    def dirpath(self) -> str:
+        return self.__theme_abspath
+
     def title(self) -> str:
         if self.ready():
             return self.__themedict[themedef.TITLE]
@@ -92,27 +106,27 @@ class WallpaperTheme:
 
     def filelist_sunrise(self) -> list:
         if self.ready():
-            return [self.__img_path_template.replace('*', str(x)) for x in self.__themedict[themedef.FILE_LIST][themedef.FL_SUNRISE]]
+            return self.__filelist(themedef.FL_SUNRISE)
         return []
 
     def filelist_noon(self) -> list:
         if self.ready():
-            return [self.__img_path_template.replace('*', str(x)) for x in self.__themedict[themedef.FILE_LIST][themedef.FL_NOON]]
+            return self.__filelist(themedef.FL_NOON)
         return []
 
     def filelist_day(self) -> list:
         if self.ready():
-            return [self.__img_path_template.replace('*', str(x)) for x in self.__themedict[themedef.FILE_LIST][themedef.FL_DAY]]
+            return self.__filelist(themedef.FL_DAY)
         return []
 
     def filelist_sunset(self) -> list:
         if self.ready():
-            return [self.__img_path_template.replace('*', str(x)) for x in self.__themedict[themedef.FILE_LIST][themedef.FL_SUNSET]]
+            return self.__filelist(themedef.FL_SUNSET)
         return []
 
     def filelist_night(self) -> list:
         if self.ready():
-            return [self.__img_path_template.replace('*', str(x)) for x in self.__themedict[themedef.FILE_LIST][themedef.FL_NIGHT]]
+            return self.__filelist(themedef.FL_NIGHT)
         return []
 
     def filelist_all(self) -> dict: